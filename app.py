@@ -1,11 +1,23 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import textwrap
-import matplotlib.pyplot as plt
-import base64
-import io
-import os
+import time
+import uuid
+from datetime import datetime
+from functools import partial
+
+import armazem
+import cache_dados
+import comparativo
+import instrumentacao
+import logos
+import otimizador
+import radar
+from indice_dados import IndiceDados
+from lancamentos import nova_proposta, novo_investido
+from instrumentacao import medir
+from motor_propostas import PropostaInvalida, csv_bytes, excel_bytes, formata_reais, ler_proposta_csv
+
+inicio_execucao = time.perf_counter()
 
 st.set_page_config(
     page_title="Simulador de ações municipais",
@@ -13,30 +25,279 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-pasta_raiz = os.path.dirname(__file__)
+# Página oculta de métricas (?metricas), disponível só com SIMULADOR_METRICAS ligado
+if instrumentacao.ATIVO and 'metricas' in st.query_params:
+    st.title('Métricas por etapa')
+    st.dataframe(pd.DataFrame(instrumentacao.resumo()), hide_index=True, width='stretch')
+    st.code(instrumentacao.texto_prometheus(), language='text')
+    st.stop()
 
 
-@st.cache_data
-def carregar_dados():
-    caminho = os.path.join(pasta_raiz, 'dados_simulador.xlsx')
-    df_mun = pd.read_excel(caminho, sheet_name='Municipios')
-    df_at = pd.read_excel(caminho, sheet_name='Atual')
-    df_pr = pd.read_excel(caminho, sheet_name='Proposta')
-    return df_mun, df_at, df_pr
+@st.cache_resource
+def carregar_indice(versao):
+    # Um índice por processo, somente leitura, dividido entre todas as sessões; `versao` é o
+    # hash da planilha. Os DataFrames lidos do cache Arrow são descartados depois de indexados
+    return IndiceDados(*cache_dados.carregar_dados())
 
 
-def get_base64_image(nome_arquivo):
-    try:
-        caminho_img = os.path.join(pasta_raiz, nome_arquivo)
-        with open(caminho_img, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode()
-    except Exception:
-        return ""
+@st.cache_resource
+def carregar_comparativo(versao, _indice):
+    return comparativo.montar(_indice)
 
 
-df_mun, df_inic_atual, df_inic_prop = carregar_dados()
-logo_sebrae = get_base64_image("logo_sebrae.png")
-logo_pp = get_base64_image("logo_politicas_publicas.png")
+@st.cache_data(max_entries=64, show_spinner=False)
+def carregar_radar(municipio, versao, _indice):
+    # PNG pronto por (município, versão dos dados); o LRU limita a memória do processo
+    return radar.radar_municipio(_indice, municipio, versao)
+
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def sugerir_proposta(municipio, orcamento_sebrae, orcamento_municipio, mapa, versao, _indice):
+    # `mapa` (iniciativa -> eixo) entra na chave: corrigir o eixos_iniciativas.csv vale no próximo clique
+    with medir('otimizador'):
+        return otimizador.otimizar(_indice, municipio, orcamento_sebrae, orcamento_municipio, mapa)
+
+
+# Memoizados pelo conteúdo das tabelas: clicar de novo sem editar nada reaproveita os bytes
+@st.cache_data(max_entries=32, show_spinner=False)
+def exportar_excel(df_investido, df_proposta, municipio):
+    with medir('excel'):
+        return excel_bytes(df_investido, df_proposta, municipio)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def exportar_csv(df_investido, df_proposta):
+    with medir('csv'):
+        return csv_bytes(df_investido, df_proposta)
+
+
+@st.cache_resource
+def abrir_armazem():
+    # Um único pool de conexões com o banco de propostas para todas as sessões do processo
+    return armazem.Armazem()
+
+
+def identificar_usuario():
+    # Com login configurado (st.login) a proposta segue o e-mail; sem ele, um código na URL
+    # identifica o navegador: recarregar a página ou abrir o link guardado retoma a proposta
+    if st.user.get('is_logged_in'):
+        return st.user.get('email')
+    if 'sessao' not in st.query_params:
+        st.query_params['sessao'] = uuid.uuid4().hex[:16]
+    return st.query_params['sessao']
+
+
+def salvar_sessao():
+    # Grava na hora as linhas alteradas: reexecuções de fragmento não passam pelo
+    # salvamento automático do início da página
+    abrir_armazem().salvar_alteracoes(identificar_usuario(), st.session_state.municipio_carregado,
+                                      st.session_state.investido, st.session_state.proposta)
+
+
+def aplicar_grid(nome, chave):
+    # Callback do data_editor: aplica só o delta da edição antes da página ser redesenhada
+    with medir('totais'):
+        st.session_state[nome].aplicar_edicoes(st.session_state[chave])
+    salvar_sessao()
+    # Só a tabela editada (com seu rodapé) e os cards finais dependem da edição
+    st.rerun([nome, 'cards'])
+
+
+def adicionar_itens(nome, registros, limpar=None):
+    for registro in registros:
+        st.session_state[nome].adicionar(registro)
+    if limpar:
+        st.session_state.pop(limpar, None)
+    salvar_sessao()
+    st.rerun([nome, 'cards'])
+
+
+def novo_registro(nome, indice):
+    # Montado no clique a partir do estado dos widgets, não dos valores de quando o botão foi
+    # desenhado: o valor digitado logo antes de clicar entra no lançamento
+    estado = st.session_state
+    if nome == 'investido':
+        inic = estado.nova_inic_at
+        val_ref = indice.ref_atual[inic]
+        if val_ref == 'Digite o valor':
+            total, sub = estado.get('valor_total_at'), estado.get('valor_sub_at')
+        else:
+            total = sub = val_ref
+        return {'INICIATIVA': inic, 'SEBRAE/PR': sub or 0.0, 'TOTAL': total or 0.0}
+    inic, sol = estado.nova_inic_pr, estado.get('nova_sol_pr')
+    if inic == 'Customizado':
+        total, sub = estado.get('valor_total_pr'), 0.0
+    else:
+        total, sub = indice.solucoes[inic].get(sol) or (0.0, 0.0)
+    return {'INICIATIVA': inic, 'SOLUCAO': sol, 'SUBSIDIO': sub or 0.0, 'VALOR': total or 0.0}
+
+
+def adicionar_novo(nome, indice):
+    adicionar_itens(nome, [novo_registro(nome, indice)])
+
+
+def limpar_solucao():
+    # Outra iniciativa: a solução escolhida para a anterior não vale mais
+    st.session_state.pop('nova_sol_pr', None)
+
+
+def exportar_excel_sessao(investido, proposta, municipio):
+    # Chamados no clique, fora da execução da página: leem as linhas atuais dos lançamentos,
+    # inclusive as editadas em reexecuções que não redesenharam os botões
+    return exportar_excel(investido.tabela(), proposta.tabela(), municipio)
+
+
+def exportar_csv_sessao(investido, proposta):
+    return exportar_csv(investido.tabela(), proposta.tabela())
+
+
+def trocar_proposta(banco, usuario, municipio, investido, proposta, descricao):
+    # Guarda a proposta atual no histórico antes de substituí-la por inteiro
+    atual_at, atual_pr = st.session_state.investido, st.session_state.proposta
+    if not (atual_at.vazia and atual_pr.vazia):
+        banco.salvar_versao(usuario, municipio, atual_at, atual_pr, descricao)
+    banco.substituir(usuario, municipio, investido, proposta)
+    st.session_state.investido, st.session_state.proposta = investido, proposta
+
+
+@st.fragment(key='investido')
+def secao_investido(indice):
+    investido = st.session_state.investido
+    st.subheader('Montante Investido Atualmente')
+    with st.expander("➕ Lançar Investimento Atual", expanded=investido.vazia):
+        col_at_inic, col_at_val = st.columns([2, 1])
+        with col_at_inic:
+            inic_at_sel = st.selectbox('Iniciativa', options=indice.iniciativas_atual, index=None,
+                                       placeholder='Selecione a iniciativa', key='nova_inic_at')
+        if inic_at_sel:
+            val_ref = indice.ref_atual[inic_at_sel]
+            with col_at_val:
+                if val_ref == 'Digite o valor':
+                    st.number_input('Valor Total', value=None, min_value=0.0, format='%.2f',
+                                    placeholder='Digite o valor', key='valor_total_at')
+                    st.number_input('Valor Subsídio (Sebrae)', value=None, min_value=0.0, format='%.2f',
+                                    placeholder='Digite o valor', key='valor_sub_at')
+                else:
+                    st.info(f"**Total: R\$ {formata_reais(val_ref)}** (Subsídio 100%)")
+            st.button('Adicionar ao Investido Atualmente', use_container_width=True, on_click=adicionar_novo,
+                      args=('investido', indice))
+
+    if not investido.vazia:
+        with medir('grid_at'):
+            st.data_editor(investido.tabela(), column_config={
+                'INICIATIVA': st.column_config.TextColumn('Iniciativa', disabled=True),
+                'SEBRAE/PR': st.column_config.NumberColumn('SEBRAE/PR (R$)', format='R$ %.2f'),
+                'MUNICIPIO': st.column_config.NumberColumn('Município (R$)', format='R$ %.2f', disabled=True),
+                'TOTAL': st.column_config.NumberColumn('Total (R$)', format='R$ %.2f')}, num_rows='dynamic',
+                           hide_index=True, width='stretch', key='grid_at', on_change=aplicar_grid,
+                           args=('investido', 'grid_at'))
+        tot_at = investido.totais
+        st.markdown(
+            f'<div style="display: flex; justify-content: flex-end; gap: 40px; background-color: #f0f2f6; padding: 5px 10px; border-radius: 0 0 10px 10px; margin-top: -20px; margin-bottom: 20px; border: 1px solid #d1d5db;"><span>TOTAL JÁ INVESTIDO:</span><span>Sebrae: <b>R$ {formata_reais(tot_at["SEBRAE/PR"])}</b></span><span>Município: <b>R$ {formata_reais(tot_at["MUNICIPIO"])}</b></span><span>Total: <b>R$ {formata_reais(tot_at["TOTAL"])}</b></span></div>',
+            unsafe_allow_html=True)
+
+
+@st.fragment(key='proposta')
+def secao_proposta(indice, municipio, versao):
+    proposta = st.session_state.proposta
+    st.subheader('Proposta de Parceria')
+    with st.expander("➕ Adicionar Item na Proposta", expanded=proposta.vazia):
+        col_pr_inic, col_pr_sol = st.columns(2)
+        with col_pr_inic:
+            nova_inic_pr = st.selectbox('Iniciativa', options=indice.iniciativas_proposta, index=None,
+                                        placeholder='Selecione a iniciativa', key='nova_inic_pr',
+                                        on_change=limpar_solucao)
+        if nova_inic_pr:
+            sols_filtradas = indice.solucoes[nova_inic_pr]
+            lista_sols = indice.opcoes_solucao[nova_inic_pr]
+            with col_pr_sol:
+                nova_sol_pr = st.selectbox('Solução', options=lista_sols, placeholder='Selecione a solução',
+                                           index=None if lista_sols != ('-',) else 0, disabled=lista_sols == ('-',),
+                                           key='nova_sol_pr')
+            if nova_inic_pr == 'Customizado':
+                st.number_input('Valor Total Customizado', value=None, min_value=0.0, format='%.2f',
+                                key='valor_total_pr')
+            else:
+                match = sols_filtradas.get(nova_sol_pr)
+                if match: st.info(
+                    f"**Total: R\$ {formata_reais(match[0])}** | **Subsídio: R\$ {formata_reais(match[1])}**")
+            st.button('Adicionar à Proposta', use_container_width=True, on_click=adicionar_novo,
+                      args=('proposta', indice))
+
+    with st.expander("🎯 Sugerir proposta pelo orçamento"):
+        st.caption("Combina soluções do portfólio priorizando os eixos mais fracos do município no IDAN-M "
+                   "(uma solução por iniciativa).")
+        col_orc_s, col_orc_m = st.columns(2)
+        orc_s = col_orc_s.number_input('Orçamento Sebrae/PR (R$)', min_value=0.0, value=100000.0, step=10000.0,
+                                       format='%.2f')
+        orc_m = col_orc_m.number_input('Orçamento Município (R$)', min_value=0.0, value=150000.0, step=10000.0,
+                                       format='%.2f')
+        if st.button('Gerar sugestão', use_container_width=True):
+            mapa = otimizador.carregar_mapa_eixos()
+            st.session_state.sugestao = (municipio, sugerir_proposta(municipio, orc_s, orc_m, mapa, versao, indice))
+        if st.session_state.get('sugestao') and st.session_state.sugestao[0] == municipio:
+            sugestao = st.session_state.sugestao[1]
+            st.dataframe(sugestao, hide_index=True, width='stretch', column_config={
+                'INICIATIVA': 'Iniciativa', 'SOLUCAO': 'Solução', 'EIXO': 'Eixo',
+                'SUBSIDIO': st.column_config.NumberColumn('SEBRAE/PR (R$)', format='R$ %.2f'),
+                'VALOR_MUNICIPIO': st.column_config.NumberColumn('Município (R$)', format='R$ %.2f'),
+                'VALOR': st.column_config.NumberColumn('Total (R$)', format='R$ %.2f')})
+            st.info(f"**Sebrae: R\$ {formata_reais(sugestao['SUBSIDIO'].sum())}** | "
+                    f"**Município: R\$ {formata_reais(sugestao['VALOR_MUNICIPIO'].sum())}**")
+            st.button('Adicionar sugestão à proposta', use_container_width=True, on_click=adicionar_itens,
+                      args=('proposta', sugestao.to_dict('records'), 'sugestao'))
+
+    if not proposta.vazia:
+        with medir('grid_pr'):
+            st.data_editor(proposta.tabela(), column_config={
+                'INICIATIVA': st.column_config.TextColumn('Iniciativa', disabled=True),
+                'SOLUCAO': st.column_config.TextColumn('Solução', disabled=True),
+                'SUBSIDIO': st.column_config.NumberColumn('SEBRAE/PR (R$)', format='R$ %.2f'),
+                'VALOR_MUNICIPIO': st.column_config.NumberColumn('Município (R$)', format='R$ %.2f', disabled=True),
+                'VALOR': st.column_config.NumberColumn('Total (R$)', format='R$ %.2f')}, num_rows='dynamic',
+                           hide_index=True, width='stretch', key='grid_pr', on_change=aplicar_grid,
+                           args=('proposta', 'grid_pr'))
+        tot_pr = proposta.totais
+        st.markdown(
+            f'<div style="display: flex; justify-content: flex-end; gap: 40px; background-color: #f0f2f6; padding: 5px 10px; border-radius: 0 0 10px 10px; margin-top: -20px; margin-bottom: 20px; border: 1px solid #d1d5db;"><span>TOTAL PROPOSTA:</span><span>Sebrae: <b>R$ {formata_reais(tot_pr["SUBSIDIO"])}</b></span><span>Município: <b>R$ {formata_reais(tot_pr["VALOR_MUNICIPIO"])}</b></span><span>Total: <b>R$ {formata_reais(tot_pr["VALOR"])}</b></span></div>',
+            unsafe_allow_html=True)
+
+
+@st.fragment(key='cards')
+def cards_finais():
+    tot_at, tot_pr = st.session_state.investido.totais, st.session_state.proposta.totais
+    tot_g, tot_s, tot_m = (tot_at['TOTAL'] + tot_pr['VALOR'], tot_at['SEBRAE/PR'] + tot_pr['SUBSIDIO'],
+                           tot_at['MUNICIPIO'] + tot_pr['VALOR_MUNICIPIO'])
+
+    st.markdown(f'''
+    <style>
+        .footer-container {{ display: flex; justify-content: space-between; gap: 10px; margin-top: 20px; padding-bottom: 40px; }}
+        .skew-card {{ flex: 1; height: 100px; transform: skewX(-27deg); display: flex; align-items: center; justify-content: center; box-shadow: 4px 4px 10px rgba(0,0,0,0.1); }}
+        .card-content {{ transform: skewX(27deg); text-align: center; color: white; }}
+        .card-title {{ font-size: 0.5rem; font-weight: bold; margin: 0; text-transform: uppercase; }}
+        .card-value {{ font-size: 2rem; margin: 0; font-weight: 800; }}
+        .bg-total {{ background-color: #003d7a; }}
+        .bg-sebrae {{ background-color: #0054A6; }}
+        .bg-municipio {{ background-color: #0054A6; }}
+    </style>
+    <div class="footer-container">
+        <div class="skew-card bg-total"><div class="card-content"><p class="card-title">Total</p><h2 class="card-value">R$ {formata_reais(tot_g)}</h2></div></div>
+        <div class="skew-card bg-sebrae"><div class="card-content"><p class="card-title">Sebrae/PR</p><h2 class="card-value">R$ {formata_reais(tot_s)}</h2></div></div>
+        <div class="skew-card bg-municipio"><div class="card-content"><p class="card-title">Município</p><h2 class="card-value">R$ {formata_reais(tot_m)}</h2></div></div>
+    </div>
+    ''', unsafe_allow_html=True)
+
+
+@st.cache_resource
+def html_logos():
+    # Os logos vão por URL estática versionada em vez de base64 embutido no cabeçalho
+    return tuple(logos.html_logo(nome, altura) for nome, altura in logos.LOGOS.items())
+
+
+with medir('carregar_dados'):
+    versao = cache_dados.versao_dados()
+    indice = carregar_indice(versao)
+logo_sebrae, logo_pp = html_logos()
 
 st.markdown(f'''
     <style>
@@ -79,24 +340,19 @@ st.markdown(f'''
     </style>
 
     <div class="full-header">
-        <img src="data:image/png;base64,{logo_sebrae}" height="75">
+        {logo_sebrae}
         <div class="header-title">
             <h1 style="margin:0; font-size: 2rem; color: white; line-height: 0.8;">SIMULADOR DE AÇÕES MUNICIPAIS</h1>
             <p style="margin:0; font-size: 1.2rem; font-weight: 400; margin-top: -8px;">AMBIENTE DE NEGÓCIOS</p>
         </div>
-        <img src="data:image/png;base64,{logo_pp}" height="70">
+        {logo_pp}
     </div>
 ''', unsafe_allow_html=True)
 
 
-def formata_reais(valor):
-    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-
-ref_atual = df_inic_atual.set_index('INICIATIVA')['VALOR'].to_dict()
 pd.set_option('future.no_silent_downcasting', True)
 
-with st.sidebar:
+with st.sidebar, medir('sidebar'):
     st.markdown(f'''
         <style>
             .portfolio-container {{
@@ -140,90 +396,113 @@ with st.sidebar:
         </div>
     ''', unsafe_allow_html=True)
 
+    modo_comparativo = st.toggle('Comparar municípios')
     st.title('Município')
-    municipios = df_mun['MUN'].unique()
+    municipios = indice.municipios
     options = st.selectbox('Selecione', municipios, index=None, placeholder='Selecione o município',
                            label_visibility='collapsed')
 
     if options:
-        selec = df_mun[df_mun['MUN'] == options]
+        selec = indice.municipio(options)
         st.markdown(f'''
             <div style='line-height: 0.7; margin-bottom: 10px;'>
-                <strong>Regional:</strong> {selec['REG'].iloc[0]} <br><br>
-                <strong>Território:</strong> {selec['TER'].iloc[0]}
+                <strong>Regional:</strong> {selec.reg} <br><br>
+                <strong>Território:</strong> {selec.ter}
             </div>
         ''', unsafe_allow_html=True)
 
         st.title('IDAN-M 2025')
-        for _, linha in selec.iterrows():
+        for eixo, percentual in zip(selec.eixos, selec.percentuais):
             col_n, col_v = st.columns([3, 1])
-            col_n.markdown(f"<div style='line-height: 1; margin-bottom: 2px;'>{linha['EIXO']}</div>",
+            col_n.markdown(f"<div style='line-height: 1; margin-bottom: 2px;'>{eixo}</div>",
                            unsafe_allow_html=True)
             col_v.markdown(
-                f"<div style='line-height: 1; margin-bottom: 2px; text-align: right;'>{linha['PERCENTUAL']:.1%}</div>",
+                f"<div style='line-height: 1; margin-bottom: 2px; text-align: right;'>{percentual:.1%}</div>",
                 unsafe_allow_html=True)
 
         c_tot1, c_tot2 = st.columns([3, 1])
         c_tot1.markdown(f"<div style='font-size: 1.15rem; text-align: left;'><strong>TOTAL IDAN-M</strong></div>",
                         unsafe_allow_html=True)
         c_tot2.markdown(
-            f"<div style='font-size: 1.15rem; text-align: right;'><strong>{selec['IDAN-M'].iloc[0]:.2f}</strong></div>",
+            f"<div style='font-size: 1.15rem; text-align: right;'><strong>{selec.idan_m:.2f}</strong></div>",
             unsafe_allow_html=True)
 
         st.markdown(
             "<br><div style='font-size: 1.2rem; font-weight: bold; margin-top: -20px;margin-bottom: 5px;'>OPORTUNIDADES</div>",
             unsafe_allow_html=True)
-        eixos_zero = selec[selec['PERCENTUAL'] == 0]
-        oportunidades = eixos_zero if len(eixos_zero) > 2 else selec.nsmallest(2, 'PERCENTUAL')
-
-        for _, linha in oportunidades.iterrows():
+        for i in indice.oportunidades(options):
             col_op_n, col_op_v = st.columns([3, 1])
-            col_op_n.markdown(f"<div style='line-height: 1; margin-bottom: 2px;'>{linha['EIXO']}</div>",
+            col_op_n.markdown(f"<div style='line-height: 1; margin-bottom: 2px;'>{selec.eixos[i]}</div>",
                               unsafe_allow_html=True)
             col_op_v.markdown(
-                f"<div style='line-height: 1; margin-bottom: 2px; text-align: right;'>{linha['PERCENTUAL']:.1%}</div>",
+                f"<div style='line-height: 1; margin-bottom: 2px; text-align: right;'>{selec.percentuais[i]:.1%}</div>",
                 unsafe_allow_html=True)
 
         st.markdown('---')
 
-        categorias = selec['EIXO'].tolist()
-        valores = selec['PERCENTUAL'].tolist()
-        n = len(categorias)
-        angulos = np.linspace(0, 2 * np.pi, n, endpoint=False).tolist()
-        valores += valores[:1];
-        angulos += angulos[:1]
-
-        fig, ax = plt.subplots(figsize=(6, 6), subplot_kw=dict(polar=True))
-        fig.patch.set_alpha(0)
-        ax.set_theta_offset(np.pi / 2)
-        ax.set_theta_direction(-1)
-        ax.grid(False)
-        ax.spines['polar'].set_visible(False)
-        ax.patch.set_visible(False)
-
-        for nivel in [0.2, 0.4, 0.6, 0.8, 1.0]:
-            ax.plot(angulos, [nivel] * len(angulos), color='gray', linestyle=':', linewidth=0.5)
-        for angulo in angulos[:-1]:
-            ax.plot([angulo, angulo], [0, 1], color='gray', linestyle=':', linewidth=0.5)
-
-        ax.fill(angulos, valores, color='#0054A6', alpha=0.25)
-        ax.plot(angulos, valores, color='#0054A6', linewidth=2)
-
-        cat_quebradas = [textwrap.fill(cat, width=17) for cat in categorias]
-        ax.set_xticks(angulos[:-1])
-        ax.set_xticklabels(cat_quebradas, fontsize=11)
-        ax.set_yticks([0.2, 0.4, 0.6, 0.8, 1.0])
-        ax.set_yticklabels(['20%', '40%', '60%', '80%', '100%'], fontsize=7, color='gray')
-        ax.set_ylim(0, 1.1)
-        st.pyplot(fig)
-
-
-if options:
-    if 'df_investido' not in st.session_state:
-        st.session_state.df_investido = pd.DataFrame(columns=['INICIATIVA', 'SEBRAE/PR', 'MUNICIPIO', 'TOTAL'])
-    if 'df_proposta' not in st.session_state:
-        st.session_state.df_proposta = pd.DataFrame(
-            columns=['INICIATIVA', 'SOLUCAO', 'SUBSIDIO', 'VALOR_MUNICIPIO', 'VALOR'])
+        with medir('radar'):
+            st.image(carregar_radar(options, versao, indice), width='stretch')
+
+
+if modo_comparativo:
+    with medir('comparativo'):
+        comp = carregar_comparativo(versao, indice)
+        percentuais = comp['percentuais']
+        formato_pct = {eixo: st.column_config.NumberColumn(eixo, format='percent') for eixo in indice.eixos}
+
+        st.subheader('Comparativo IDAN-M 2025')
+        col_reg, col_ter = st.columns(2)
+        with col_reg:
+            regs = st.multiselect('Regional', sorted(percentuais['REG'].unique()), placeholder='Todas')
+        filtro = percentuais['REG'].isin(regs) if regs else pd.Series(True, index=percentuais.index)
+        with col_ter:
+            ters = st.multiselect('Território', sorted(percentuais.loc[filtro, 'TER'].unique()), placeholder='Todos')
+        if ters:
+            filtro &= percentuais['TER'].isin(ters)
+        muns = st.multiselect('Municípios', percentuais.index[filtro].tolist(), placeholder='Todos do filtro')
+        if muns:
+            filtro &= percentuais.index.isin(muns)
+
+        tab_pct, tab_rank, tab_agr, tab_op = st.tabs(['Percentuais', 'Ranking por eixo', 'Regionais e territórios',
+                                                      'Oportunidades'])
+        with tab_pct:
+            tabela = percentuais[filtro].assign(POSICAO=comp['ranking'].loc[filtro, 'IDAN-M'])
+            st.dataframe(tabela.sort_values('POSICAO'), width='stretch',
+                         column_config={'POSICAO': st.column_config.NumberColumn('Posição IDAN-M'),
+                                        'IDAN-M': st.column_config.NumberColumn('IDAN-M', format='%.2f'),
+                                        **formato_pct})
+        with tab_rank:
+            exibir = st.radio('Exibir', ['Posição', 'Percentil'], horizontal=True)
+            if exibir == 'Posição':
+                st.caption(f"Posição entre os {len(percentuais)} municípios (1 = maior percentual no eixo)")
+                st.dataframe(comp['ranking'][filtro].sort_values('IDAN-M'), width='stretch')
+            else:
+                st.caption(f"Percentil entre os {len(percentuais)} municípios (100% = maior percentual no eixo)")
+                st.dataframe(comp['percentis'][filtro].sort_values('IDAN-M', ascending=False), width='stretch',
+                             column_config={col: st.column_config.NumberColumn(col, format='percent')
+                                            for col in comp['percentis'].columns})
+        with tab_agr:
+            nivel = st.radio('Agrupar por', ['REG', 'TER'], horizontal=True,
+                             format_func={'REG': 'Regional', 'TER': 'Território'}.get)
+            st.dataframe(comparativo.agregados(percentuais[filtro], nivel, indice.eixos), width='stretch',
+                         column_config=formato_pct)
+        with tab_op:
+            st.dataframe(comp['oportunidades'][filtro], width='stretch',
+                         column_config={'QTD': st.column_config.NumberColumn('Qtd. eixos')})
+
+elif options:
+    banco, usuario = abrir_armazem(), identificar_usuario()
+    with medir('armazem'):
+        if st.session_state.get('municipio_carregado') != options:
+            # Ao trocar de município, grava o que ficou pendente do anterior e abre a proposta salva
+            if 'municipio_carregado' in st.session_state:
+                banco.salvar_alteracoes(usuario, st.session_state.municipio_carregado,
+                                        st.session_state.investido, st.session_state.proposta)
+            st.session_state.investido, st.session_state.proposta = banco.carregar(usuario, options)
+            st.session_state.municipio_carregado = options
+        investido, proposta = st.session_state.investido, st.session_state.proposta
+        # Salvamento automático: inclusões/edições da execução anterior e das grades
+        banco.salvar_alteracoes(usuario, options, investido, proposta)
 
     col_ctrl1, col_ctrl2 = st.columns([3, 1])
 
@@ -238,8 +517,7 @@ if options:
 
     with col_btn2:
         if st.button('Redefinir', use_container_width=True):
-            st.session_state.df_investido = pd.DataFrame(columns=['INICIATIVA', 'SEBRAE/PR', 'MUNICIPIO', 'TOTAL'])
-            st.session_state.df_proposta = pd.DataFrame(columns=['INICIATIVA', 'SOLUCAO', 'SUBSIDIO', 'VALOR_MUNICIPIO', 'VALOR'])
+            trocar_proposta(banco, usuario, options, novo_investido(), nova_proposta(), 'Antes de redefinir')
             st.session_state.mostrar_upload = False
             st.rerun()
 
@@ -248,159 +526,70 @@ if options:
         arquivo_csv = st.file_uploader("Escolha o arquivo", type="csv", label_visibility='collapsed')
 
         if arquivo_csv:
-            df_temp = pd.read_csv(arquivo_csv)
-            if st.button("Carregar dados do arquivo", use_container_width=True):
-                # Filtra e limpa colunas extras para cada tabela
-                df_at_limpo = df_temp[df_temp['TIPO'] == 'ATUAL'].dropna(axis=1, how='all')
-                st.session_state.df_investido = df_at_limpo.drop(columns=['TIPO'], errors='ignore').reset_index(
-                    drop=True)
-
-                df_pr_limpo = df_temp[df_temp['TIPO'] == 'PROPOSTA'].dropna(axis=1, how='all')
-                st.session_state.df_proposta = df_pr_limpo.drop(columns=['TIPO'], errors='ignore').reset_index(
-                    drop=True)
+            # Lido uma única vez por arquivo enviado, não a cada execução da página
+            if st.session_state.get('csv_id') != arquivo_csv.file_id:
+                try:
+                    st.session_state.csv_lido = ler_proposta_csv(arquivo_csv)
+                except PropostaInvalida as e:
+                    st.session_state.csv_lido = e
+                st.session_state.csv_id = arquivo_csv.file_id
+
+            if isinstance(st.session_state.csv_lido, PropostaInvalida):
+                st.error(f"Não foi possível ler o arquivo. {st.session_state.csv_lido}")
+            elif st.button("Carregar dados do arquivo", use_container_width=True):
+                df_at, df_pr = st.session_state.csv_lido
+                trocar_proposta(banco, usuario, options, novo_investido(df_at), nova_proposta(df_pr),
+                                'Antes de carregar arquivo')
+                del st.session_state.csv_lido, st.session_state.csv_id
 
                 st.session_state.mostrar_upload = False  # Fecha a área após carregar
                 st.rerun()
 
-    st.subheader('Montante Investido Atualmente')
-    with st.expander("➕ Lançar Investimento Atual", expanded=st.session_state.df_investido.empty):
-        col_at_inic, col_at_val = st.columns([2, 1])
-        with col_at_inic:
-            inic_at_sel = st.selectbox('Iniciativa', options=sorted(list(ref_atual.keys())), index=None,
-                                       placeholder='Selecione a iniciativa')
-        if inic_at_sel:
-            val_ref = ref_atual[inic_at_sel]
-            with col_at_val:
-                if val_ref == 'Digite o valor':
-                    v_total_at = st.number_input('Valor Total', value=None, min_value=0.0, format='%.2f',
-                                                 placeholder='Digite o valor')
-                    v_sub_at = st.number_input('Valor Subsídio (Sebrae)', value=None, min_value=0.0, format='%.2f',
-                                               placeholder='Digite o valor')
-                else:
-                    v_total_at = v_sub_at = val_ref
-                    st.info(f"**Total: R\$ {formata_reais(v_total_at)}** (Subsídio 100%)")
-            if st.button('Adicionar ao Investido Atualmente', use_container_width=True):
-                vt, vs = (v_total_at or 0.0), (v_sub_at or 0.0)
-                nova = {'INICIATIVA': inic_at_sel, 'SEBRAE/PR': vs, 'MUNICIPIO': vt - vs, 'TOTAL': vt}
-                st.session_state.df_investido = pd.concat([st.session_state.df_investido, pd.DataFrame([nova])],
-                                                          ignore_index=True)
-                st.rerun()
-
-    if not st.session_state.df_investido.empty:
-        edicao_at = st.data_editor(st.session_state.df_investido, column_config={
-            'INICIATIVA': st.column_config.TextColumn('Iniciativa', disabled=True),
-            'SEBRAE/PR': st.column_config.NumberColumn('SEBRAE/PR (R$)', format='R$ %.2f'),
-            'MUNICIPIO': st.column_config.NumberColumn('Município (R$)', format='R$ %.2f', disabled=True),
-            'TOTAL': st.column_config.NumberColumn('Total (R$)', format='R$ %.2f')}, num_rows='dynamic',
-                                   hide_index=True, width='stretch', key='grid_at')
-        st.session_state.df_investido = edicao_at
-        st.markdown(
-            f'<div style="display: flex; justify-content: flex-end; gap: 40px; background-color: #f0f2f6; padding: 5px 10px; border-radius: 0 0 10px 10px; margin-top: -20px; margin-bottom: 20px; border: 1px solid #d1d5db;"><span>TOTAL JÁ INVESTIDO:</span><span>Sebrae: <b>R$ {formata_reais(edicao_at["SEBRAE/PR"].sum())}</b></span><span>Município: <b>R$ {formata_reais(edicao_at["MUNICIPIO"].sum())}</b></span><span>Total: <b>R$ {formata_reais(edicao_at["TOTAL"].sum())}</b></span></div>',
-            unsafe_allow_html=True)
-
-    
-    st.subheader('Proposta de Parceria')
-    with st.expander("➕ Adicionar Item na Proposta", expanded=st.session_state.df_proposta.empty):
-        col_pr_inic, col_pr_sol = st.columns(2)
-        with col_pr_inic:
-            nova_inic_pr = st.selectbox('Iniciativa', options=sorted(df_inic_prop['INICIATIVA'].unique().tolist()),
-                                        index=None, placeholder='Selecione a iniciativa')
-        if nova_inic_pr:
-            sols_filtradas = df_inic_prop[df_inic_prop['INICIATIVA'] == nova_inic_pr]
-            lista_sols = sols_filtradas['SOLUCAO'].unique().tolist()
-            with col_pr_sol:
-                nova_sol_pr = st.selectbox('Solução', options=lista_sols, placeholder='Selecione a solução',
-                                           index=None if lista_sols != ['-'] else 0, disabled=lista_sols == ['-'])
-            if nova_inic_pr == 'Customizado':
-                v_total_pr, v_sub_pr = st.number_input('Valor Total Customizado', value=None, min_value=0.0,
-                                                       format='%.2f'), 0.0
+    with st.expander("🕘 Versões salvas"):
+        st.caption("A proposta é salva automaticamente a cada alteração. Guarde uma versão para poder voltar a ela.")
+        descricao = st.text_input('Descrição da versão', placeholder='Ex.: proposta apresentada ao prefeito')
+        # Sem `disabled`: as inclusões reexecutam só os fragmentos, e o botão ficaria desativado
+        # depois do primeiro item. A proposta vazia é verificada no clique
+        if st.button('Salvar versão atual', use_container_width=True):
+            if investido.vazia and proposta.vazia:
+                st.toast('A proposta está vazia: não há o que guardar.')
             else:
-                match = sols_filtradas[sols_filtradas['SOLUCAO'] == nova_sol_pr]
-                v_total_pr = match['VALOR'].iloc[0] if not match.empty else 0.0
-                v_sub_pr = match['SUBSIDIO'].iloc[0] if not match.empty else 0.0
-                if not match.empty: st.info(
-                    f"**Total: R\$ {formata_reais(v_total_pr)}** | **Subsídio: R\$ {formata_reais(v_sub_pr)}**")
-            if st.button('Adicionar à Proposta', use_container_width=True):
-                vt_p, vs_p = (v_total_pr or 0.0), (v_sub_pr or 0.0)
-                nova_p = {'INICIATIVA': nova_inic_pr, 'SOLUCAO': nova_sol_pr, 'SUBSIDIO': vs_p,
-                          'VALOR_MUNICIPIO': vt_p - vs_p, 'VALOR': vt_p}
-                st.session_state.df_proposta = pd.concat([st.session_state.df_proposta, pd.DataFrame([nova_p])],
-                                                         ignore_index=True)
+                banco.salvar_versao(usuario, options, investido, proposta, descricao or 'Versão salva')
+                st.toast('Versão salva.')
+        versoes = banco.versoes(usuario, options)
+        if versoes:
+            rotulos = {id_versao: f"{datetime.fromtimestamp(criada_em):%d/%m/%Y %H:%M} — {desc} "
+                                  f"(R$ {formata_reais(total)})"
+                       for id_versao, criada_em, desc, total in versoes}
+            id_versao = st.selectbox('Versão', options=list(rotulos), format_func=rotulos.get)
+            if st.button('Restaurar versão', use_container_width=True):
+                trocar_proposta(banco, usuario, options, *banco.abrir_versao(usuario, id_versao),
+                                'Antes de restaurar versão')
                 st.rerun()
 
-    if not st.session_state.df_proposta.empty:
-        edicao_pr = st.data_editor(st.session_state.df_proposta, column_config={
-            'INICIATIVA': st.column_config.TextColumn('Iniciativa', disabled=True),
-            'SOLUCAO': st.column_config.TextColumn('Solução', disabled=True),
-            'SUBSIDIO': st.column_config.NumberColumn('SEBRAE/PR (R$)', format='R$ %.2f'),
-            'VALOR_MUNICIPIO': st.column_config.NumberColumn('Município (R$)', format='R$ %.2f', disabled=True),
-            'VALOR': st.column_config.NumberColumn('Total (R$)', format='R$ %.2f')}, num_rows='dynamic',
-                                   hide_index=True, width='stretch', key='grid_pr')
-        st.session_state.df_proposta = edicao_pr
-        st.markdown(
-            f'<div style="display: flex; justify-content: flex-end; gap: 40px; background-color: #f0f2f6; padding: 5px 10px; border-radius: 0 0 10px 10px; margin-top: -20px; margin-bottom: 20px; border: 1px solid #d1d5db;"><span>TOTAL PROPOSTA:</span><span>Sebrae: <b>R$ {formata_reais(edicao_pr["SUBSIDIO"].sum())}</b></span><span>Município: <b>R$ {formata_reais(edicao_pr["VALOR_MUNICIPIO"].sum())}</b></span><span>Total: <b>R$ {formata_reais(edicao_pr["VALOR"].sum())}</b></span></div>',
-            unsafe_allow_html=True)
+    # Cada parte abaixo reexecuta sozinha: um widget de uma tabela reexecuta só aquela tabela,
+    # e as inclusões/edições de linhas reexecutam também os cards (st.rerun([tabela, 'cards'])
+    # nos callbacks). Cabeçalho, barra lateral, radar e exportações só rodam com a página inteira.
+    secao_investido(indice)
+    secao_proposta(indice, options, versao)
 
-    
     st.divider()
-    df1_f, df2_f = st.session_state.df_investido.fillna(0), st.session_state.df_proposta.fillna(0)
-    tot_g, tot_s, tot_m = df1_f['TOTAL'].sum() + df2_f['VALOR'].sum(), df1_f['SEBRAE/PR'].sum() + df2_f[
-        'SUBSIDIO'].sum(), df1_f['MUNICIPIO'].sum() + df2_f['VALOR_MUNICIPIO'].sum()
-
-    st.markdown(f'''
-    <style>
-        .footer-container {{ display: flex; justify-content: space-between; gap: 10px; margin-top: 20px; padding-bottom: 40px; }}
-        .skew-card {{ flex: 1; height: 100px; transform: skewX(-27deg); display: flex; align-items: center; justify-content: center; box-shadow: 4px 4px 10px rgba(0,0,0,0.1); }}
-        .card-content {{ transform: skewX(27deg); text-align: center; color: white; }}
-        .card-title {{ font-size: 0.5rem; font-weight: bold; margin: 0; text-transform: uppercase; }}
-        .card-value {{ font-size: 2rem; margin: 0; font-weight: 800; }}
-        .bg-total {{ background-color: #003d7a; }}
-        .bg-sebrae {{ background-color: #0054A6; }}
-        .bg-municipio {{ background-color: #0054A6; }}
-    </style>
-    <div class="footer-container">
-        <div class="skew-card bg-total"><div class="card-content"><p class="card-title">Total</p><h2 class="card-value">R$ {formata_reais(tot_g)}</h2></div></div>
-        <div class="skew-card bg-sebrae"><div class="card-content"><p class="card-title">Sebrae/PR</p><h2 class="card-value">R$ {formata_reais(tot_s)}</h2></div></div>
-        <div class="skew-card bg-municipio"><div class="card-content"><p class="card-title">Município</p><h2 class="card-value">R$ {formata_reais(tot_m)}</h2></div></div>
-    </div>
-    ''', unsafe_allow_html=True)
-
+    cards_finais()
 
     st.divider()
     col_ex1, col_ex2 = st.columns(2)
     with col_ex1:
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-            workbook = writer.book
-            fmt_moeda = workbook.add_format({'num_format': 'R$ #,##0.00'})
-            fmt_header = workbook.add_format({'bold': True, 'font_color': '#0054A6', 'font_size': 12})
-            sheet_name = 'Resumo_Proposta'
-
-            st.session_state.df_investido.to_excel(writer, sheet_name=sheet_name, startrow=2, index=False)
-            row_prop = len(st.session_state.df_investido) + 5
-            st.session_state.df_proposta.to_excel(writer, sheet_name=sheet_name, startrow=row_prop, index=False)
-
-            ws = writer.sheets[sheet_name]
-            ws.set_column(1, 4, 18, fmt_moeda)
-            ws.write(0, 0, f"SIMULADOR DE AÇÕES MUNICIPAIS: {options}", fmt_header)
-            ws.write(1, 0, "JÁ INVESTIDO NO MUNICÍPIO", fmt_header)
-            ws.write(row_prop - 1, 0, "PROPOSTA DE PARCERIA", fmt_header)
-
-            row_total = row_prop + len(st.session_state.df_proposta) + 3
-            ws.write(row_total, 0, "CONSOLIDADO FINAL", fmt_header)
-            ws.write(row_total + 1, 0, "Investimento Total:");
-            ws.write(row_total + 1, 1, tot_g, fmt_moeda)
-            ws.write(row_total + 2, 0, "Subsídio Sebrae/PR:");
-            ws.write(row_total + 2, 1, tot_s, fmt_moeda)
-            ws.write(row_total + 3, 0, "Aporte Município:");
-            ws.write(row_total + 3, 1, tot_m, fmt_moeda)
-        st.download_button("Exportar para Excel (.xlsx) 📥", data=buffer.getvalue(),
-                           file_name=f"proposta_acoes_{options}.xlsx", use_container_width=True)
+        # Os arquivos só são gerados no clique, a partir das linhas atuais dos lançamentos
+        st.download_button("Exportar para Excel (.xlsx) 📥",
+                           data=partial(exportar_excel_sessao, investido, proposta, options),
+                           file_name=f"proposta_acoes_{options}.xlsx", on_click='ignore', use_container_width=True)
 
     with col_ex2:
-        df_csv = pd.concat(
-            [st.session_state.df_investido.assign(TIPO='ATUAL'), st.session_state.df_proposta.assign(TIPO='PROPOSTA')],
-            ignore_index=True)
-        st.download_button("Salvar proposta (.csv) 💾", data=df_csv.to_csv(index=False).encode('utf-8-sig'),
-
-                           file_name=f"{options}_proposta_salva.csv", mime="text/csv", use_container_width=True)
+        st.download_button("Salvar proposta (.csv) 💾",
+                           data=partial(exportar_csv_sessao, investido, proposta),
+                           file_name=f"{options}_proposta_salva.csv", mime="text/csv", on_click='ignore',
+                           use_container_width=True)
+
+if instrumentacao.ATIVO:
+    instrumentacao.registrar('execucao', time.perf_counter() - inicio_execucao)
+    instrumentacao.descarregar_periodicamente()
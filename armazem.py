@@ -0,0 +1,217 @@
+import json
+import os
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+from itertools import groupby
+
+from lancamentos import nova_proposta, novo_investido
+
+pasta_raiz = os.path.dirname(os.path.abspath(__file__))
+
+# Banco embutido com as propostas em andamento, por (usuário, município)
+CAMINHO_BANCO = os.environ.get('SIMULADOR_BANCO', os.path.join(pasta_raiz, 'propostas.db'))
+TAMANHO_POOL = int(os.environ.get('SIMULADOR_BANCO_CONEXOES', '8'))
+# Versões guardadas por (usuário, município); as mais antigas são descartadas
+MAX_VERSOES = 50
+TABELAS = ('ATUAL', 'PROPOSTA')
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS linhas (
+    usuario TEXT NOT NULL, municipio TEXT NOT NULL, tabela TEXT NOT NULL, id INTEGER NOT NULL,
+    dados TEXT NOT NULL, alterado_em REAL NOT NULL,
+    PRIMARY KEY (usuario, municipio, tabela, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS versoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT NOT NULL, municipio TEXT NOT NULL,
+    criada_em REAL NOT NULL, descricao TEXT NOT NULL, total REAL NOT NULL, conteudo TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versoes_chave ON versoes (usuario, municipio, criada_em);
+CREATE TABLE IF NOT EXISTS sequencias (
+    usuario TEXT NOT NULL, municipio TEXT NOT NULL, proximo_id INTEGER NOT NULL,
+    PRIMARY KEY (usuario, municipio)
+) WITHOUT ROWID;
+'''
+
+
+def _escalar(valor):
+    # Números do NumPy/pandas que o json não serializa sozinho
+    if hasattr(valor, 'item'):
+        return valor.item()
+    return str(valor)
+
+
+def _json(valor):
+    return json.dumps(valor, ensure_ascii=False, default=_escalar)
+
+
+def _reservar_ids(con, usuario, municipio, quantidade):
+    # Dentro da transação (BEGIN IMMEDIATE): duas abas com a mesma proposta nunca recebem o
+    # mesmo id, e um id removido não é reaproveitado. Bancos anteriores à tabela de sequências
+    # partem do maior id gravado.
+    linha = con.execute('SELECT proximo_id FROM sequencias WHERE usuario = ? AND municipio = ?',
+                        (usuario, municipio)).fetchone()
+    if linha is None:
+        linha = con.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM linhas WHERE usuario = ? AND municipio = ?',
+                            (usuario, municipio)).fetchone()
+    inicio = linha[0]
+    con.execute('INSERT OR REPLACE INTO sequencias VALUES (?, ?, ?)', (usuario, municipio, inicio + quantidade))
+    return iter(range(inicio, inicio + quantidade))
+
+
+class Armazem:
+    # Conexões reaproveitadas entre as sessões do Streamlit (cada uma roda em sua thread).
+    # Em WAL as leituras não esperam as gravações, e as gravações de sessões diferentes
+    # entram em fila pelo busy_timeout em vez de falhar com "database is locked".
+
+    def __init__(self, caminho=CAMINHO_BANCO, tamanho_pool=TAMANHO_POOL):
+        self.caminho = caminho
+        self._livres = queue.LifoQueue()
+        self._vagas = queue.Queue()
+        for _ in range(tamanho_pool):
+            self._vagas.put(None)
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        with self.conexao() as con:
+            con.executescript(ESQUEMA)
+
+    def _conectar(self):
+        con = sqlite3.connect(self.caminho, timeout=30, isolation_level=None, check_same_thread=False)
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute('PRAGMA synchronous=NORMAL')
+        con.execute('PRAGMA busy_timeout=30000')
+        return con
+
+    @contextmanager
+    def conexao(self):
+        try:
+            con = self._livres.get_nowait()
+        except queue.Empty:
+            # Abre uma conexão nova enquanto houver vaga no pool; depois, espera uma ser devolvida
+            try:
+                self._vagas.get_nowait()
+                con = self._conectar()
+            except queue.Empty:
+                con = self._livres.get()
+        try:
+            yield con
+        finally:
+            self._livres.put(con)
+
+    @contextmanager
+    def transacao(self):
+        # BEGIN IMMEDIATE reserva a escrita no início: duas sessões não travam uma à outra
+        # tentando promover uma leitura a gravação no meio da transação
+        with self.conexao() as con:
+            con.execute('BEGIN IMMEDIATE')
+            try:
+                yield con
+            except BaseException:
+                con.execute('ROLLBACK')
+                raise
+            con.execute('COMMIT')
+
+    def carregar(self, usuario, municipio):
+        investido, proposta = novo_investido(), nova_proposta()
+        with self.conexao() as con:
+            cursor = con.execute('SELECT tabela, id, dados FROM linhas WHERE usuario = ? AND municipio = ? '
+                                 'ORDER BY tabela, id', (usuario, municipio))
+            pares = {tabela: [] for tabela in TABELAS}
+            for tabela, id_linha, dados in cursor:
+                pares[tabela].append((id_linha, json.loads(dados)))
+        return investido.restaurar(pares['ATUAL']), proposta.restaurar(pares['PROPOSTA'])
+
+    def todas(self):
+        # Todas as propostas gravadas, uma de cada vez, na ordem da chave primária (sem ordenar
+        # o banco inteiro): (usuario, municipio, investido, proposta)
+        with self.conexao() as con:
+            cursor = con.execute('SELECT usuario, municipio, tabela, id, dados FROM linhas '
+                                 'ORDER BY usuario, municipio, tabela, id')
+            for (usuario, municipio), grupo in groupby(cursor, key=lambda linha: linha[:2]):
+                pares = {tabela: [] for tabela in TABELAS}
+                for _, _, tabela, id_linha, dados in grupo:
+                    pares[tabela].append((id_linha, json.loads(dados)))
+                yield (usuario, municipio, novo_investido().restaurar(pares['ATUAL']),
+                       nova_proposta().restaurar(pares['PROPOSTA']))
+
+    def salvar_alteracoes(self, usuario, municipio, investido, proposta):
+        # Grava só as linhas incluídas, editadas ou removidas desde a última chamada. Linhas novas
+        # ganham ids reservados no banco; edições de linhas que outra aba removeu (ou substituiu
+        # com Redefinir/arquivo/versão) não as trazem de volta
+        lancamentos = dict(zip(TABELAS, (investido, proposta)))
+        alterados = {tabela: lanc.extrair_alterados() for tabela, lanc in lancamentos.items()}
+        if not any(alterados.values()):
+            return 0
+        agora = time.time()
+        novas, atualizar, remover = [], [], []
+        for tabela, linhas in alterados.items():
+            for id_linha, linha in linhas.items():
+                if id_linha < 0:
+                    if linha is not None:
+                        novas.append((tabela, id_linha, _json(linha)))
+                elif linha is None:
+                    remover.append((usuario, municipio, tabela, id_linha))
+                else:
+                    atualizar.append((_json(linha), agora, usuario, municipio, tabela, id_linha))
+        definitivos = {tabela: {} for tabela in TABELAS}
+        with self.transacao() as con:
+            con.executemany('DELETE FROM linhas WHERE usuario = ? AND municipio = ? AND tabela = ? AND id = ?',
+                            remover)
+            con.executemany('UPDATE linhas SET dados = ?, alterado_em = ? '
+                            'WHERE usuario = ? AND municipio = ? AND tabela = ? AND id = ?', atualizar)
+            ids = _reservar_ids(con, usuario, municipio, len(novas))
+            gravar = []
+            for tabela, provisorio, dados in novas:
+                definitivos[tabela][provisorio] = next(ids)
+                gravar.append((usuario, municipio, tabela, definitivos[tabela][provisorio], dados, agora))
+            con.executemany('INSERT INTO linhas VALUES (?, ?, ?, ?, ?, ?)', gravar)
+        for tabela, lanc in lancamentos.items():
+            lanc.confirmar_ids(definitivos[tabela])
+        return len(novas) + len(atualizar) + len(remover)
+
+    def substituir(self, usuario, municipio, investido, proposta):
+        # Troca a proposta inteira (Redefinir, arquivo .csv carregado, versão restaurada). Todas as
+        # linhas ganham ids novos: edições pendentes de outra aba não alcançam a proposta nova
+        agora = time.time()
+        lancamentos = dict(zip(TABELAS, (investido, proposta)))
+        investido.extrair_alterados()
+        proposta.extrair_alterados()
+        definitivos = {tabela: {} for tabela in TABELAS}
+        with self.transacao() as con:
+            con.execute('DELETE FROM linhas WHERE usuario = ? AND municipio = ?', (usuario, municipio))
+            ids = _reservar_ids(con, usuario, municipio, len(investido) + len(proposta))
+            linhas = []
+            for tabela, lanc in lancamentos.items():
+                for id_linha, linha in zip(lanc.ids, lanc.linhas):
+                    definitivos[tabela][id_linha] = next(ids)
+                    linhas.append((usuario, municipio, tabela, definitivos[tabela][id_linha], _json(linha), agora))
+            con.executemany('INSERT INTO linhas VALUES (?, ?, ?, ?, ?, ?)', linhas)
+        for tabela, lanc in lancamentos.items():
+            lanc.confirmar_ids(definitivos[tabela])
+
+    def salvar_versao(self, usuario, municipio, investido, proposta, descricao):
+        conteudo = {tabela: list(zip(lanc.ids, lanc.linhas)) for tabela, lanc in zip(TABELAS, (investido, proposta))}
+        total = investido.totais[investido.col_total] + proposta.totais[proposta.col_total]
+        with self.transacao() as con:
+            con.execute('INSERT INTO versoes (usuario, municipio, criada_em, descricao, total, conteudo) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (usuario, municipio, time.time(), descricao, total, _json(conteudo)))
+            con.execute('DELETE FROM versoes WHERE usuario = ? AND municipio = ? AND id NOT IN '
+                        '(SELECT id FROM versoes WHERE usuario = ? AND municipio = ? ORDER BY id DESC LIMIT ?)',
+                        (usuario, municipio, usuario, municipio, MAX_VERSOES))
+
+    def versoes(self, usuario, municipio):
+        # Mais recentes primeiro: (id, criada_em, descricao, total)
+        with self.conexao() as con:
+            return con.execute('SELECT id, criada_em, descricao, total FROM versoes '
+                               'WHERE usuario = ? AND municipio = ? ORDER BY id DESC',
+                               (usuario, municipio)).fetchall()
+
+    def abrir_versao(self, usuario, id_versao):
+        with self.conexao() as con:
+            linha = con.execute('SELECT conteudo FROM versoes WHERE usuario = ? AND id = ?',
+                                (usuario, id_versao)).fetchone()
+        if linha is None:
+            raise KeyError(id_versao)
+        conteudo = json.loads(linha[0])
+        return novo_investido().restaurar(conteudo['ATUAL']), nova_proposta().restaurar(conteudo['PROPOSTA'])
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+pasta_raiz = os.path.dirname(os.path.abspath(__file__))
+
+CAMINHO_BASELINE = os.path.join(pasta_raiz, 'benchmark_baseline.json')
+ESCALAS_PADRAO = [1, 10, 100]
+ETAPAS = ['cache_planilha', 'carga', 'sidebar_radar', 'grades', 'totais', 'exportacao']
+TOLERANCIA = 0.20
+
+
+def gerar_planilha(destino, escala):
+    # Replica municípios e o catálogo de soluções `escala` vezes, com nomes distintos
+    from motor_propostas import MAX_LINHAS_XLSX
+
+    # A aba Municipios tem uma linha de cabeçalho antes dos dados
+    max_linhas = MAX_LINHAS_XLSX - 1
+    original = pd.read_excel(os.path.join(pasta_raiz, 'dados_simulador.xlsx'), sheet_name=None)
+    df_mun, df_at, df_pr = original['Municipios'], original['Atual'], original['Proposta']
+    if len(df_mun) * escala > max_linhas:
+        raise ValueError(f"Escala {escala} gera {len(df_mun) * escala} linhas em Municipios, "
+                         f"acima do limite do Excel ({max_linhas}).")
+
+    def replicar(df, coluna):
+        if escala == 1:
+            return df
+        copias = [df.assign(**{coluna: df[coluna] + f' {i:04d}'}) if i else df for i in range(escala)]
+        return pd.concat(copias, ignore_index=True)
+
+    with pd.ExcelWriter(destino, engine='xlsxwriter') as writer:
+        replicar(df_mun, 'MUN').to_excel(writer, sheet_name='Municipios', index=False)
+        df_at.to_excel(writer, sheet_name='Atual', index=False)
+        replicar(df_pr, 'INICIATIVA').to_excel(writer, sheet_name='Proposta', index=False)
+
+
+def tamanho_profundo(obj, vistos=None):
+    # Bytes de `obj` e do que ele referencia. Os esquemas das tabelas são do processo, não da
+    # sessão, e ficam de fora
+    from lancamentos import Esquema
+
+    vistos = set() if vistos is None else vistos
+    if id(obj) in vistos or isinstance(obj, (type, Esquema)):
+        return 0
+    vistos.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, dict):
+        filhos = [*obj.keys(), *obj.values()]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        filhos = obj
+    else:
+        filhos = [getattr(obj, nome) for nome in getattr(type(obj), '__slots__', ()) if hasattr(obj, nome)]
+        filhos += list(getattr(obj, '__dict__', {}).values())
+    return sys.getsizeof(obj) + sum(tamanho_profundo(filho, vistos) for filho in filhos)
+
+
+def _cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def executar_cenario(n_itens, n_municipios):
+    # Roda dentro de um subprocesso já configurado com SIMULADOR_PLANILHA/SIMULADOR_CACHE
+    import warnings
+    warnings.simplefilter('ignore')
+    from streamlit.testing.v1 import AppTest
+
+    import cache_dados
+    from indice_dados import IndiceDados
+    from motor_propostas import csv_bytes, excel_bytes
+
+    etapas = {}
+    etapas['cache_planilha'], _ = _cronometrar(cache_dados.construir_cache)
+    indice = IndiceDados(*cache_dados.carregar_dados())
+
+    at = AppTest.from_file(os.path.join(pasta_raiz, 'app.py'), default_timeout=600)
+    etapas['carga'], _ = _cronometrar(at.run)
+
+    tempos = []
+    passo = max(1, len(indice.municipios) // n_municipios)
+    for municipio in indice.municipios[::passo][:n_municipios]:
+        tempos.append(_cronometrar(at.sidebar.selectbox[0].select(municipio).run)[0])
+    etapas['sidebar_radar'] = statistics.median(tempos)
+
+    iniciativa = next(i for i in indice.iniciativas_proposta if i != 'Customizado')
+    solucao = next(iter(indice.solucoes[iniciativa]))
+    tempos = []
+    for _ in range(n_itens):
+        # Depois de um clique só o fragmento da proposta é redesenhado: a última 'Iniciativa' é sempre a dela
+        [sel for sel in at.selectbox if sel.label == 'Iniciativa'][-1].select(iniciativa).run()
+        [sel for sel in at.selectbox if sel.label == 'Solução'][0].select(solucao).run()
+        botao = next(b for b in at.button if b.label == 'Adicionar à Proposta')
+        tempos.append(_cronometrar(botao.click().run)[0])
+    etapas['grades'] = statistics.median(tempos) if tempos else 0.0
+
+    # O data_editor não é acionável pelo AppTest: aplica o mesmo delta que a grade enviaria
+    proposta = at.session_state.proposta
+    delta = {'edited_rows': {i: {'VALOR': 1000.0 + i} for i in range(len(proposta))},
+             'added_rows': [], 'deleted_rows': []}
+    etapas['totais'], _ = _cronometrar(proposta.aplicar_edicoes, delta)
+
+    investido, tabela = at.session_state.investido.tabela(), proposta.tabela()
+    inicio = time.perf_counter()
+    excel_bytes(investido, tabela, 'benchmark')
+    csv_bytes(investido, tabela)
+    etapas['exportacao'] = time.perf_counter() - inicio
+
+    # Pico de memória residente do processo (ru_maxrss vem em KB no Linux) e o que uma sessão
+    # guarda em st.session_state, que é o que cresce com o número de usuários simultâneos
+    return {'etapas': etapas, 'memoria_pico_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'memoria_sessao_kb': tamanho_profundo(at.session_state.to_dict()) / 1024,
+            'linhas_proposta': len(proposta), 'excecoes': [str(e.value) for e in at.exception]}
+
+
+def medir_escala(escala, n_itens, n_municipios):
+    with tempfile.TemporaryDirectory() as tmp:
+        planilha = os.path.join(tmp, f'dados_x{escala}.xlsx')
+        gerar_planilha(planilha, escala)
+        env = dict(os.environ, SIMULADOR_PLANILHA=planilha, SIMULADOR_CACHE=os.path.join(tmp, 'cache'),
+                   SIMULADOR_BANCO=os.path.join(tmp, 'propostas.db'))
+        saida = subprocess.run([sys.executable, __file__, '--cenario', '--itens', str(n_itens),
+                                '--municipios', str(n_municipios)],
+                               env=env, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def relatorio(resultados, baseline=None):
+    linhas = []
+    for escala, r in resultados.items():
+        base = (baseline or {}).get(escala)
+        linhas.append(f"escala x{escala} — {r['linhas_proposta']} itens na proposta, "
+                      f"pico de memória {r['memoria_pico_mb']:.0f} MB, "
+                      f"estado da sessão {r.get('memoria_sessao_kb', 0):.1f} KB")
+        for etapa in ETAPAS:
+            valor = r['etapas'][etapa]
+            texto = f"  {etapa:<15} {valor * 1000:10.1f} ms"
+            if base and base['etapas'].get(etapa):
+                variacao = valor / base['etapas'][etapa] - 1
+                texto += f"  ({variacao:+.0%} vs. baseline{'  <-- REGRESSÃO' if variacao > TOLERANCIA else ''})"
+            linhas.append(texto)
+        for excecao in r['excecoes']:
+            linhas.append(f"  exceção no app: {excecao}")
+    return '\n'.join(linhas)
+
+
+def regressoes(resultados, baseline):
+    return [(escala, etapa) for escala, r in resultados.items() if escala in baseline
+            for etapa in ETAPAS
+            if baseline[escala]['etapas'].get(etapa)
+            and r['etapas'][etapa] > baseline[escala]['etapas'][etapa] * (1 + TOLERANCIA)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mede o tempo de execução do app.py em planilhas sintéticas.')
+    parser.add_argument('--escalas', type=int, nargs='+', default=ESCALAS_PADRAO,
+                        help='multiplicadores do tamanho de dados_simulador.xlsx')
+    parser.add_argument('--itens', type=int, default=20, help='itens adicionados à proposta por cenário')
+    parser.add_argument('--municipios', type=int, default=5, help='municípios selecionados por cenário')
+    parser.add_argument('--salvar-baseline', action='store_true')
+    parser.add_argument('--baseline', default=CAMINHO_BASELINE)
+    parser.add_argument('--cenario', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cenario:
+        print(json.dumps(executar_cenario(args.itens, args.municipios)))
+        return
+
+    resultados = {str(escala): medir_escala(escala, args.itens, args.municipios) for escala in args.escalas}
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print(relatorio(resultados, baseline))
+
+    if args.salvar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+        print(f"Baseline salva em {args.baseline}")
+    elif baseline and regressoes(resultados, baseline):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow.feather as feather
+
+pasta_raiz = os.path.dirname(os.path.abspath(__file__))
+
+# As variáveis de ambiente permitem apontar para outra planilha (ex.: benchmark.py)
+CAMINHO_PLANILHA = os.environ.get('SIMULADOR_PLANILHA', os.path.join(pasta_raiz, 'dados_simulador.xlsx'))
+PASTA_CACHE = os.environ.get('SIMULADOR_CACHE', os.path.join(pasta_raiz, '.cache_dados'))
+ABAS = ('Municipios', 'Atual', 'Proposta')
+VERSAO_FORMATO = 1
+MANIFESTO = 'manifesto.json'
+# Colunas como VALOR misturam números e o texto 'Digite o valor'; o Arrow exige
+# um tipo por coluna, então a parte textual vai para uma coluna auxiliar.
+SUFIXO_TEXTO = '__TEXTO'
+
+
+# Pastas de cache em que não foi possível gravar: o processo não tenta de novo
+_pastas_somente_leitura = set()
+# Hash por (caminho, mtime, tamanho): a planilha só é relida quando muda
+_hashes = {}
+
+
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _hash_memorizado(caminho, stat):
+    chave = (caminho, stat.st_mtime_ns, stat.st_size)
+    if chave not in _hashes:
+        _hashes.clear()
+        _hashes[chave] = hash_arquivo(caminho)
+    return _hashes[chave]
+
+
+def _verificar_pasta(pasta):
+    # Antes de ler a planilha: uma pasta somente leitura falha aqui, sem o hash e o read_excel
+    os.makedirs(pasta, exist_ok=True)
+    if not os.access(pasta, os.W_OK):
+        raise PermissionError(f'sem permissão de escrita em {pasta}')
+
+
+def _caminho_aba(pasta, aba):
+    return os.path.join(pasta, f'{aba}.arrow')
+
+
+def _ler_manifesto(pasta):
+    try:
+        with open(os.path.join(pasta, MANIFESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_atomico(caminho, gravar):
+    # Grava em arquivo temporário e troca de uma vez: outras réplicas lendo o
+    # cache nunca enxergam um arquivo pela metade.
+    tmp = f'{caminho}.{os.getpid()}.tmp'
+    try:
+        gravar(tmp)
+        os.replace(tmp, caminho)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _gravar_manifesto(pasta, manifesto):
+    def gravar(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, ensure_ascii=False, indent=2)
+
+    _gravar_atomico(os.path.join(pasta, MANIFESTO), gravar)
+
+
+def _separar_mistas(df):
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        numeros = pd.to_numeric(df[col], errors='coerce')
+        textos = df[col].where(numeros.isna() & df[col].notna())
+        df[col] = numeros.astype('float64')
+        if textos.notna().any():
+            df[col + SUFIXO_TEXTO] = textos.astype('str').where(textos.notna())
+    return df
+
+
+def _juntar_mistas(df):
+    for col_texto in [c for c in df.columns if c.endswith(SUFIXO_TEXTO)]:
+        col = col_texto[:-len(SUFIXO_TEXTO)]
+        textos = df.pop(col_texto)
+        mistura = df[col].astype(object)
+        mistura[textos.notna()] = textos[textos.notna()]
+        df[col] = mistura
+    return df
+
+
+def cache_valido(caminho=CAMINHO_PLANILHA, pasta=PASTA_CACHE):
+    manifesto = _ler_manifesto(pasta)
+    if not manifesto or manifesto.get('versao_formato') != VERSAO_FORMATO:
+        return None
+    if not all(os.path.exists(_caminho_aba(pasta, aba)) for aba in ABAS):
+        return None
+
+    stat = os.stat(caminho)
+    if manifesto['mtime_ns'] == stat.st_mtime_ns and manifesto['tamanho'] == stat.st_size:
+        return manifesto
+
+    # mtime mudou (checkout, cópia no deploy): só reconstrói se o conteúdo mudou
+    if _hash_memorizado(caminho, stat) != manifesto['sha256']:
+        return None
+    manifesto.update(mtime_ns=stat.st_mtime_ns, tamanho=stat.st_size)
+    try:
+        _gravar_manifesto(pasta, manifesto)
+    except OSError:
+        pass
+    return manifesto
+
+
+def construir_cache(caminho=CAMINHO_PLANILHA, pasta=PASTA_CACHE):
+    _verificar_pasta(pasta)
+    stat = os.stat(caminho)
+    sha256 = _hash_memorizado(caminho, stat)
+    abas = pd.read_excel(caminho, sheet_name=list(ABAS))
+
+    linhas = {}
+    for aba in ABAS:
+        df = _separar_mistas(abas[aba])
+        _gravar_atomico(_caminho_aba(pasta, aba),
+                        lambda tmp, df=df: feather.write_feather(df, tmp, compression='uncompressed'))
+        linhas[aba] = len(df)
+
+    manifesto = {'versao_formato': VERSAO_FORMATO, 'planilha': os.path.basename(caminho),
+                 'mtime_ns': stat.st_mtime_ns, 'tamanho': stat.st_size, 'sha256': sha256, 'linhas': linhas}
+    _gravar_manifesto(pasta, manifesto)
+    return manifesto
+
+
+def ler_cache(pasta=PASTA_CACHE):
+    # Sem compressão o arquivo Arrow é mapeado em memória direto do disco
+    return tuple(_juntar_mistas(feather.read_table(_caminho_aba(pasta, aba), memory_map=True).to_pandas())
+                 for aba in ABAS)
+
+
+def _tentar_construir(caminho, pasta):
+    # None quando a pasta não aceita escrita; a falha vale para o resto do processo
+    if pasta in _pastas_somente_leitura:
+        return None
+    try:
+        return construir_cache(caminho, pasta)
+    except OSError:
+        _pastas_somente_leitura.add(pasta)
+        return None
+
+
+def versao_dados(caminho=CAMINHO_PLANILHA, pasta=PASTA_CACHE):
+    # Chamada a cada execução da página: com o cache válido custa um stat
+    manifesto = cache_valido(caminho, pasta) or _tentar_construir(caminho, pasta)
+    if manifesto is None:
+        # Pasta somente leitura: identifica a versão pelo próprio arquivo
+        return _hash_memorizado(caminho, os.stat(caminho))
+    return manifesto['sha256']
+
+
+def carregar_dados(caminho=CAMINHO_PLANILHA, pasta=PASTA_CACHE):
+    if cache_valido(caminho, pasta) is None and _tentar_construir(caminho, pasta) is None:
+        abas = pd.read_excel(caminho, sheet_name=list(ABAS))
+        return tuple(abas[aba] for aba in ABAS)
+    return ler_cache(pasta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pré-compila dados_simulador.xlsx em cache colunar (Arrow).')
+    parser.add_argument('--planilha', default=CAMINHO_PLANILHA)
+    parser.add_argument('--pasta', default=PASTA_CACHE)
+    parser.add_argument('--forcar', action='store_true', help='reconstrói mesmo se o cache estiver válido')
+    args = parser.parse_args()
+
+    manifesto = None if args.forcar else cache_valido(args.planilha, args.pasta)
+    if manifesto is None:
+        manifesto = construir_cache(args.planilha, args.pasta)
+        print(f"Cache gerado em {args.pasta}")
+    else:
+        print(f"Cache já atualizado em {args.pasta}")
+    print(f"sha256: {manifesto['sha256']}")
+    for aba, n in manifesto['linhas'].items():
+        print(f"  {aba}: {n} linhas")
+
+
+if __name__ == '__main__':
+    main()
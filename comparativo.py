@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+
+def mascara_oportunidades(matriz):
+    # Mesma regra da barra lateral aplicada a todas as linhas de uma vez: eixos zerados
+    # quando há mais de dois, senão os dois menores percentuais
+    zerados = matriz == 0
+    ordem = np.argsort(np.where(np.isnan(matriz), np.inf, matriz), axis=1, kind='stable')[:, :2]
+    menores = np.zeros_like(zerados)
+    np.put_along_axis(menores, ordem, True, axis=1)
+    return np.where((zerados.sum(axis=1) > 2)[:, None], zerados, menores)
+
+
+def montar(indice):
+    municipios = [indice.por_municipio[nome] for nome in indice.municipios]
+    percentuais = pd.DataFrame(indice.matriz, index=pd.Index(indice.municipios, name='MUN'), columns=indice.eixos)
+    percentuais.insert(0, 'REG', [m.reg for m in municipios])
+    percentuais.insert(1, 'TER', [m.ter for m in municipios])
+    percentuais.insert(2, 'IDAN-M', [m.idan_m for m in municipios])
+
+    valores = percentuais[['IDAN-M'] + indice.eixos]
+    # Int64 (com nulo): um município sem a linha de algum eixo fica sem posição nele
+    ranking = valores.rank(ascending=False, method='min').astype('Int64')
+    percentis = valores.rank(pct=True)
+
+    mascara = mascara_oportunidades(indice.matriz)
+    nomes = np.array(indice.eixos, dtype=object)
+    # Dentro de cada município, lista do menor para o maior percentual
+    ordem = np.argsort(np.where(mascara, indice.matriz, np.inf), axis=1, kind='stable')
+    oportunidades = pd.DataFrame({
+        'REG': percentuais['REG'], 'TER': percentuais['TER'],
+        'OPORTUNIDADES': [', '.join(nomes[linha[:n]]) for linha, n in zip(ordem, mascara.sum(axis=1))],
+        'QTD': mascara.sum(axis=1)})
+
+    return {'percentuais': percentuais, 'ranking': ranking, 'percentis': percentis,
+            'oportunidades': oportunidades}
+
+
+def agregados(percentuais, nivel, eixos):
+    grupos = percentuais.groupby(nivel)
+    medias = grupos[['IDAN-M'] + eixos].mean()
+    idan = grupos['IDAN-M'].quantile([0.25, 0.5, 0.75]).unstack()
+    idan.columns = ['IDAN-M P25', 'IDAN-M P50', 'IDAN-M P75']
+    return pd.concat([grupos.size().rename('MUNICIPIOS'), medias, idan], axis=1)
@@ -0,0 +1,215 @@
+import argparse
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+import armazem
+import cache_dados
+from indice_dados import IndiceDados
+from motor_propostas import (LINHAS_POR_BLOCO, MAX_LINHAS_XLSX, PropostaInvalida, calcular_totais, escrever_resumo,
+                             formata_reais, formatos_resumo, ler_proposta_csv, linhas_resumo, listar_arquivos,
+                             municipio_do_arquivo)
+
+PASTA_SAIDA = 'consolidado_estadual'
+ARQUIVO_XLSX = 'consolidado_estadual.xlsx'
+
+COLUNAS_MUNICIPIOS = ['ORIGEM', 'MUN', 'REG', 'TER', 'ITENS_ATUAL', 'ITENS_PROPOSTA',
+                      'ATUAL_SEBRAE/PR', 'ATUAL_MUNICIPIO', 'ATUAL_TOTAL',
+                      'PROPOSTA_SEBRAE/PR', 'PROPOSTA_MUNICIPIO', 'PROPOSTA_TOTAL',
+                      'SEBRAE/PR', 'MUNICIPIO', 'TOTAL']
+COLUNAS_INICIATIVAS = ['TIPO', 'INICIATIVA', 'PROPOSTAS', 'ITENS', 'SEBRAE/PR', 'MUNICIPIO', 'TOTAL']
+COLUNAS_REGIONAIS = ['REG', 'TER', 'PROPOSTAS', 'SEBRAE/PR', 'MUNICIPIO', 'TOTAL', 'PCT_SEBRAE']
+
+ESQUEMA_ITENS = pa.schema([('ORIGEM', pa.string()), ('MUN', pa.string()), ('REG', pa.string()),
+                           ('TER', pa.string()), ('TIPO', pa.string()), ('INICIATIVA', pa.string()),
+                           ('SOLUCAO', pa.string()), ('SEBRAE/PR', pa.float64()), ('MUNICIPIO', pa.float64()),
+                           ('TOTAL', pa.float64())])
+ESQUEMA_MUNICIPIOS = pa.schema([(col, pa.string()) for col in COLUNAS_MUNICIPIOS[:4]]
+                               + [(col, pa.int64()) for col in COLUNAS_MUNICIPIOS[4:6]]
+                               + [(col, pa.float64()) for col in COLUNAS_MUNICIPIOS[6:]])
+
+
+class _ParquetEmBlocos:
+    # Acumula linhas e grava um row group a cada LINHAS_POR_BLOCO: a memória não cresce
+    # com o número de propostas
+
+    def __init__(self, caminho, esquema):
+        self.esquema = esquema
+        self.escritor = pq.ParquetWriter(caminho, esquema, compression='zstd')
+        self.linhas = []
+
+    def escrever(self, linhas):
+        self.linhas.extend(linhas)
+        if len(self.linhas) >= LINHAS_POR_BLOCO:
+            self._descarregar()
+
+    def _descarregar(self):
+        if self.linhas:
+            colunas = zip(*self.linhas)
+            # from_pandas: NaN das células vazias vira nulo no Parquet
+            self.escritor.write_table(pa.table([pa.array(list(valores), type=campo.type, from_pandas=True)
+                                                for valores, campo in zip(colunas, self.esquema)],
+                                               schema=self.esquema))
+            self.linhas = []
+
+    def fechar(self):
+        self._descarregar()
+        self.escritor.close()
+
+
+def _num(valor):
+    return 0.0 if pd.isna(valor) else float(valor)
+
+
+def _texto(valor):
+    return None if pd.isna(valor) else str(valor)
+
+
+def _itens(df_investido, df_proposta):
+    # As duas tabelas com as mesmas colunas: (TIPO, INICIATIVA, SOLUCAO, Sebrae, Município, Total)
+    for inic, sebrae, municipio, total in df_investido[['INICIATIVA', 'SEBRAE/PR', 'MUNICIPIO', 'TOTAL']].itertuples(
+            index=False, name=None):
+        yield 'ATUAL', _texto(inic), None, _num(sebrae), _num(municipio), _num(total)
+    for inic, sol, sebrae, municipio, total in df_proposta[['INICIATIVA', 'SOLUCAO', 'SUBSIDIO', 'VALOR_MUNICIPIO',
+                                                            'VALOR']].itertuples(index=False, name=None):
+        yield 'PROPOSTA', _texto(inic), _texto(sol), _num(sebrae), _num(municipio), _num(total)
+
+
+def _somar(acumulado, chave, valores):
+    soma = acumulado.setdefault(chave, [0] * len(valores))
+    for i, valor in enumerate(valores):
+        soma[i] += valor
+
+
+def _nova_aba(workbook, nome, colunas, colunas_texto, fmt):
+    ws = workbook.add_worksheet(nome)
+    ws.set_column(0, colunas_texto - 1, 28)
+    ws.set_column(colunas_texto, len(colunas) - 1, 18, fmt['moeda'])
+    ws.write_row(0, 0, colunas)
+    return ws
+
+
+def _escrever_linha(ws, linha, valores):
+    ws.write_row(linha, 0, [None if pd.isna(valor) else valor for valor in valores])
+
+
+def exportar(propostas, pasta_saida=PASTA_SAIDA, indice=None):
+    # `propostas` é um iterável de (origem, municipio, df_investido, df_proposta), consumido uma
+    # proposta por vez. Gera o .xlsx estadual em modo constant_memory (cada linha vai para o
+    # disco assim que a próxima começa) e o conjunto Parquet em row groups.
+    os.makedirs(pasta_saida, exist_ok=True)
+    regioes = {nome: (m.reg, m.ter) for nome, m in indice.por_municipio.items()} if indice is not None else {}
+
+    workbook = xlsxwriter.Workbook(os.path.join(pasta_saida, ARQUIVO_XLSX), {'constant_memory': True})
+    fmt = formatos_resumo(workbook)
+    # As abas de totais vêm na frente; Iniciativas e Regionais só são preenchidas no fim
+    ws_mun = _nova_aba(workbook, 'Municipios', COLUNAS_MUNICIPIOS, 6, fmt)
+    ws_inic = _nova_aba(workbook, 'Iniciativas', COLUNAS_INICIATIVAS, 4, fmt)
+    ws_reg = _nova_aba(workbook, 'Regionais', COLUNAS_REGIONAIS, 3, fmt)
+    ws_reg.set_column(6, 6, 12, workbook.add_format({'num_format': '0.0%'}))
+    abas_resumo = []
+
+    def nova_aba_resumo():
+        ws = workbook.add_worksheet('Propostas' if not abas_resumo else f'Propostas_{len(abas_resumo) + 1}')
+        ws.set_column(1, 4, 18, fmt['moeda'])
+        abas_resumo.append(ws)
+        return ws
+
+    itens = _ParquetEmBlocos(os.path.join(pasta_saida, 'itens.parquet'), ESQUEMA_ITENS)
+    municipios = _ParquetEmBlocos(os.path.join(pasta_saida, 'municipios.parquet'), ESQUEMA_MUNICIPIOS)
+    por_iniciativa, por_regiao, contagem = {}, {}, 0
+    ws_resumo, linha_resumo = nova_aba_resumo(), 0
+    try:
+        for origem, municipio, df_investido, df_proposta in propostas:
+            reg, ter = regioes.get(municipio, (None, None))
+            linhas = list(_itens(df_investido, df_proposta))
+            itens.escrever([(origem, municipio, reg, ter, *linha) for linha in linhas])
+
+            somas = {'ATUAL': [0.0, 0.0, 0.0], 'PROPOSTA': [0.0, 0.0, 0.0]}
+            vistas = set()
+            for tipo, inic, _, sebrae, mun, total in linhas:
+                _somar(somas, tipo, (sebrae, mun, total))
+                _somar(por_iniciativa, (tipo, inic), (0 if (tipo, inic) in vistas else 1, 1, sebrae, mun, total))
+                vistas.add((tipo, inic))
+            totais = [a + p for a, p in zip(somas['ATUAL'], somas['PROPOSTA'])]
+            _somar(por_regiao, (reg, ter), (1, *totais))
+
+            linha_mun = (origem, municipio, reg, ter, len(df_investido), len(df_proposta),
+                         *somas['ATUAL'], *somas['PROPOSTA'], *totais)
+            contagem += 1
+            _escrever_linha(ws_mun, contagem, linha_mun)
+            municipios.escrever([linha_mun])
+
+            # Mesmo layout da aba Resumo_Proposta do botão "Exportar para Excel", um bloco por proposta;
+            # ao atingir o limite de linhas do Excel, a aba Propostas continua em Propostas_2, _3...
+            if linha_resumo + linhas_resumo(df_investido, df_proposta) > MAX_LINHAS_XLSX:
+                ws_resumo, linha_resumo = nova_aba_resumo(), 0
+            linha_resumo = escrever_resumo(ws_resumo, linha_resumo, df_investido, df_proposta,
+                                           f"{municipio} ({origem})",
+                                           calcular_totais(df_investido, df_proposta), fmt) + 1
+    finally:
+        itens.fechar()
+        municipios.fechar()
+
+    df_inic = pd.DataFrame([(*chave, *valores) for chave, valores in por_iniciativa.items()],
+                           columns=COLUNAS_INICIATIVAS).sort_values(['TIPO', 'INICIATIVA'], na_position='last')
+    df_reg = pd.DataFrame([(*chave, *valores) for chave, valores in por_regiao.items()],
+                          columns=COLUNAS_REGIONAIS[:-1]).sort_values(['REG', 'TER'], na_position='last')
+    df_reg['PCT_SEBRAE'] = (df_reg['SEBRAE/PR'] / df_reg['TOTAL'].where(df_reg['TOTAL'] != 0)).fillna(0.0)
+    df_inic.to_parquet(os.path.join(pasta_saida, 'iniciativas.parquet'), index=False)
+    df_reg.to_parquet(os.path.join(pasta_saida, 'regionais.parquet'), index=False)
+
+    for ws, df in ((ws_inic, df_inic), (ws_reg, df_reg)):
+        for i, valores in enumerate(df.itertuples(index=False, name=None), start=1):
+            _escrever_linha(ws, i, valores)
+    workbook.close()
+    return contagem, df_reg
+
+
+def propostas_do_banco(banco):
+    for usuario, municipio, investido, proposta in banco.todas():
+        yield usuario, municipio, investido.tabela(), proposta.tabela()
+
+
+def propostas_dos_arquivos(arquivos, erros):
+    for caminho in arquivos:
+        try:
+            df_at, df_pr = ler_proposta_csv(caminho)
+        except PropostaInvalida as e:
+            erros.append(f"{os.path.basename(caminho)}: {e}")
+            continue
+        yield os.path.basename(caminho), municipio_do_arquivo(caminho), df_at, df_pr
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exporta o consolidado estadual das propostas (.xlsx e Parquet).')
+    parser.add_argument('entradas', nargs='*',
+                        help='arquivos, padrões glob ou pastas com os .csv salvos; sem entradas, lê o banco do app')
+    parser.add_argument('--banco', default=armazem.CAMINHO_BANCO)
+    parser.add_argument('--saida', default=PASTA_SAIDA)
+    args = parser.parse_args()
+
+    erros = []
+    if args.entradas:
+        arquivos = listar_arquivos(args.entradas)
+        if not arquivos:
+            parser.error('nenhum arquivo .csv encontrado')
+        propostas = propostas_dos_arquivos(arquivos, erros)
+    else:
+        if not os.path.exists(args.banco):
+            parser.error(f'banco de propostas não encontrado: {args.banco}')
+        propostas = propostas_do_banco(armazem.Armazem(args.banco, tamanho_pool=1))
+    indice = IndiceDados(*cache_dados.carregar_dados())
+    contagem, df_reg = exportar(propostas, args.saida, indice)
+    print(f"{contagem} propostas exportadas em {args.saida}")
+    for erro in erros:
+        print(f"  ignorado: {erro}")
+    print(f"Total: R$ {formata_reais(df_reg['TOTAL'].sum())} | Sebrae/PR: R$ {formata_reais(df_reg['SEBRAE/PR'].sum())}"
+          f" | Município: R$ {formata_reais(df_reg['MUNICIPIO'].sum())}")
+
+
+if __name__ == '__main__':
+    main()
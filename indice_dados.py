@@ -0,0 +1,67 @@
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+Municipio = namedtuple('Municipio', ['nome', 'reg', 'ter', 'idan_m', 'eixos', 'percentuais'])
+
+
+def _texto(valor):
+    # Regional/território se repetem em centenas de municípios: um único objeto por nome
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
+class IndiceDados:
+    # Montado uma vez por versão da planilha e compartilhado, somente leitura, por todas as
+    # sessões do processo (st.cache_resource); cada interação da tela faz só consultas em
+    # dicionário em vez de filtrar os DataFrames, que não ficam guardados no índice.
+
+    def __init__(self, df_mun, df_at, df_pr):
+        self.por_municipio = {}
+        self.municipios = pd.unique(df_mun['MUN']).tolist()
+        # Matriz município x eixo (mesma ordem de self.municipios / self.eixos) para comparações
+        self.eixos = pd.unique(df_mun['EIXO']).tolist()
+        self.matriz = (df_mun.pivot(index='MUN', columns='EIXO', values='PERCENTUAL')
+                       .reindex(index=self.municipios, columns=self.eixos).to_numpy(dtype='float64'))
+        self.matriz.flags.writeable = False
+
+        eixos = df_mun['EIXO'].to_numpy(dtype=object)
+        percentuais = df_mun['PERCENTUAL'].to_numpy(dtype='float64')
+        reg, ter, idan = df_mun['REG'].to_numpy(), df_mun['TER'].to_numpy(), df_mun['IDAN-M'].to_numpy()
+        ordem_padrao = tuple(self.eixos)
+        # A planilha já vem em ordem alfabética; mantém a ordem de exibição original.
+        # Municípios com os eixos na ordem padrão dividem a mesma tupla de nomes e leem os
+        # percentuais direto da linha da matriz, sem cópia por município
+        for i, (nome, linhas) in enumerate(df_mun.groupby('MUN', sort=False).indices.items()):
+            eixos_mun = tuple(eixos[linhas].tolist())
+            if eixos_mun == ordem_padrao:
+                eixos_mun, pct = ordem_padrao, self.matriz[i]
+            else:
+                pct = percentuais[linhas]
+                pct.flags.writeable = False
+            j = linhas[0]
+            self.por_municipio[nome] = Municipio(nome, _texto(reg[j]), _texto(ter[j]), float(idan[j]), eixos_mun, pct)
+
+        self.ref_atual = df_at.set_index('INICIATIVA')['VALOR'].to_dict()
+        self.iniciativas_atual = tuple(sorted(self.ref_atual.keys()))
+
+        # INICIATIVA -> SOLUCAO -> (VALOR, SUBSIDIO), preservando a ordem da planilha;
+        # em soluções repetidas vale a primeira linha, como no filtro original
+        self.solucoes = {}
+        for inic, sol, valor, sub in zip(df_pr['INICIATIVA'], df_pr['SOLUCAO'], df_pr['VALOR'], df_pr['SUBSIDIO']):
+            self.solucoes.setdefault(inic, {}).setdefault(sol, (valor, sub))
+        self.iniciativas_proposta = tuple(sorted(self.solucoes.keys()))
+        # Opções do seletor de solução, prontas para cada iniciativa
+        self.opcoes_solucao = {inic: tuple(sols) for inic, sols in self.solucoes.items()}
+
+    def municipio(self, nome):
+        return self.por_municipio[nome]
+
+    def oportunidades(self, nome):
+        # Eixos zerados quando há mais de dois; senão os dois menores percentuais
+        pct = self.por_municipio[nome].percentuais
+        zerados = np.flatnonzero(pct == 0)
+        if len(zerados) > 2:
+            return zerados
+        return np.argsort(pct, kind='stable')[:2]
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import cache_dados
+
+# SIMULADOR_METRICAS=1 mede tempos; =memoria também mede o pico de memória de cada etapa (tracemalloc,
+# mais lento). O tracemalloc é global ao processo: o pico inclui o que outras sessões alocaram ao mesmo
+# tempo, e serve para comparar etapas num servidor com pouco uso ou no benchmark, não para contabilidade
+MODO = os.environ.get('SIMULADOR_METRICAS', '').strip().lower()
+ATIVO = MODO not in ('', '0', 'false', 'nao', 'não')
+MEDIR_MEMORIA = MODO == 'memoria'
+ARQUIVO = os.environ.get('SIMULADOR_METRICAS_ARQUIVO', os.path.join(cache_dados.PASTA_CACHE, 'metricas.jsonl'))
+INTERVALO = float(os.environ.get('SIMULADOR_METRICAS_INTERVALO', '60'))
+# Amostras guardadas por etapa para o cálculo de p50/p95
+JANELA = 1000
+
+_trava = threading.Lock()
+_amostras = {}
+_contagem = {}
+_soma = {}
+_memoria = {}
+_memoria_max = {}
+_local = threading.local()
+_ultimo_envio = time.monotonic()
+
+if MEDIR_MEMORIA and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def registrar(etapa, segundos, memoria=0):
+    with _trava:
+        _amostras.setdefault(etapa, deque(maxlen=JANELA)).append(segundos)
+        _contagem[etapa] = _contagem.get(etapa, 0) + 1
+        _soma[etapa] = _soma.get(etapa, 0.0) + segundos
+        _memoria[etapa] = _memoria.get(etapa, 0) + memoria
+        _memoria_max[etapa] = max(_memoria_max.get(etapa, 0), memoria)
+
+
+def _abrir_pico():
+    # Pico acima da memória em uso no início da etapa. Etapas aninhadas (o radar dentro da
+    # sidebar) zeram o pico do tracemalloc: o da etapa externa é guardado na pilha antes
+    pilha = _local.__dict__.setdefault('pilha', [])
+    atual, pico = tracemalloc.get_traced_memory()
+    if pilha:
+        pilha[-1][1] = max(pilha[-1][1], pico)
+    tracemalloc.reset_peak()
+    quadro = [atual, atual]
+    pilha.append(quadro)
+    return quadro
+
+
+def _fechar_pico(quadro):
+    pilha = _local.pilha
+    pilha.pop()
+    pico = max(quadro[1], tracemalloc.get_traced_memory()[1])
+    if pilha:
+        pilha[-1][1] = max(pilha[-1][1], pico)
+    return pico - quadro[0]
+
+
+@contextmanager
+def _span(etapa):
+    quadro = _abrir_pico() if MEDIR_MEMORIA else None
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(etapa, time.perf_counter() - inicio, _fechar_pico(quadro) if MEDIR_MEMORIA else 0)
+
+
+def medir(etapa):
+    # Desligado, devolve um contexto vazio: o custo no caminho quente é uma chamada de função
+    return _span(etapa) if ATIVO else nullcontext()
+
+
+def _percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+
+def resumo():
+    with _trava:
+        etapas = {etapa: sorted(amostras) for etapa, amostras in _amostras.items()}
+        contagem, soma, memoria, memoria_max = dict(_contagem), dict(_soma), dict(_memoria), dict(_memoria_max)
+    return [{'etapa': etapa, 'contagem': contagem[etapa],
+             'p50_ms': _percentil(ordenadas, 0.50) * 1000, 'p95_ms': _percentil(ordenadas, 0.95) * 1000,
+             'media_ms': soma[etapa] / contagem[etapa] * 1000,
+             'memoria_pico_media_kb': memoria[etapa] / contagem[etapa] / 1024,
+             'memoria_pico_max_kb': memoria_max[etapa] / 1024}
+            for etapa, ordenadas in etapas.items()]
+
+
+def texto_prometheus():
+    linhas = ['# TYPE simulador_etapa_segundos summary']
+    itens = resumo()
+    for item in itens:
+        rotulo = f'etapa="{item["etapa"]}"'
+        linhas.append(f'simulador_etapa_segundos{{{rotulo},quantile="0.5"}} {item["p50_ms"] / 1000:.6f}')
+        linhas.append(f'simulador_etapa_segundos{{{rotulo},quantile="0.95"}} {item["p95_ms"] / 1000:.6f}')
+        linhas.append(f'simulador_etapa_segundos_sum{{{rotulo}}} {item["media_ms"] * item["contagem"] / 1000:.6f}')
+        linhas.append(f'simulador_etapa_segundos_count{{{rotulo}}} {item["contagem"]}')
+    if MEDIR_MEMORIA:
+        linhas.append('# TYPE simulador_etapa_memoria_pico_bytes gauge')
+        for item in itens:
+            linhas.append(f'simulador_etapa_memoria_pico_bytes{{etapa="{item["etapa"]}"}} '
+                          f'{item["memoria_pico_media_kb"] * 1024:.0f}')
+    return '\n'.join(linhas) + '\n'
+
+
+def descarregar(arquivo=ARQUIVO):
+    # Acrescenta um retrato no .jsonl e regrava o .prom ao lado, para o coletor do Prometheus
+    os.makedirs(os.path.dirname(arquivo) or '.', exist_ok=True)
+    with open(arquivo, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'instante': time.time(), 'pid': os.getpid(), 'etapas': resumo()},
+                           ensure_ascii=False) + '\n')
+    prom = os.path.splitext(arquivo)[0] + '.prom'
+    tmp = f'{prom}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(texto_prometheus())
+    os.replace(tmp, prom)
+
+
+def descarregar_periodicamente():
+    global _ultimo_envio
+    if not ATIVO:
+        return
+    with _trava:
+        if time.monotonic() - _ultimo_envio < INTERVALO:
+            return
+        _ultimo_envio = time.monotonic()
+    try:
+        descarregar()
+    except OSError:
+        pass
@@ -0,0 +1,136 @@
+import math
+from collections import namedtuple
+from types import MappingProxyType
+
+import pandas as pd
+
+from motor_propostas import COLUNAS_ATUAL, COLUNAS_PROPOSTA
+
+
+def _num(valor):
+    # Células vazias do data_editor chegam como None/NaN e contam como zero nos totais
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return 0.0
+    return float(valor)
+
+
+# Descrição de cada tabela, única no processo e compartilhada por todas as sessões
+Esquema = namedtuple('Esquema', ['colunas', 'col_sebrae', 'col_municipio', 'col_total', 'pos'])
+
+
+def _esquema(colunas, col_sebrae, col_municipio, col_total):
+    return Esquema(tuple(colunas), col_sebrae, col_municipio, col_total,
+                   MappingProxyType({col: i for i, col in enumerate(colunas)}))
+
+
+ESQUEMA_ATUAL = _esquema(COLUNAS_ATUAL, 'SEBRAE/PR', 'MUNICIPIO', 'TOTAL')
+ESQUEMA_PROPOSTA = _esquema(COLUNAS_PROPOSTA, 'SUBSIDIO', 'VALOR_MUNICIPIO', 'VALOR')
+
+
+class Lancamentos:
+    # Linhas de uma das tabelas da proposta com os totais mantidos a cada alteração,
+    # sem refazer as somas a cada execução da página. É o que fica em st.session_state:
+    # só as linhas (listas de valores) e os totais; colunas e posições vêm do esquema
+    # compartilhado, e o DataFrame de exibição é montado na execução e descartado.
+
+    __slots__ = ('esquema', 'linhas', 'ids', 'alterados', '_proximo_temporario', '_centavos', 'totais')
+
+    def __init__(self, esquema, df=None):
+        self.esquema = esquema
+        self.linhas = []
+        # Identificador estável de cada linha (não muda quando outras são removidas) e
+        # as linhas alteradas desde a última gravação (None = removida). Linhas novas recebem
+        # ids negativos provisórios; o definitivo é reservado pelo banco ao gravar (confirmar_ids)
+        self.ids = []
+        self.alterados = {}
+        self._proximo_temporario = -1
+        # Somas em centavos inteiros: incluir e remover as mesmas linhas volta exatamente a zero,
+        # sem o resíduo de ponto flutuante que apareceria como "R$ -0,00"
+        self._centavos = dict.fromkeys([esquema.col_sebrae, esquema.col_municipio, esquema.col_total], 0)
+        self.totais = dict.fromkeys(self._centavos, 0.0)
+        if df is not None:
+            for registro in df.reindex(columns=list(self.colunas)).to_dict('records'):
+                self.adicionar(registro)
+
+    @property
+    def colunas(self):
+        return self.esquema.colunas
+
+    @property
+    def col_total(self):
+        return self.esquema.col_total
+
+    def __len__(self):
+        return len(self.linhas)
+
+    @property
+    def vazia(self):
+        return not self.linhas
+
+    def _somar(self, linha, sinal):
+        pos = self.esquema.pos
+        for col in self._centavos:
+            self._centavos[col] += sinal * round(_num(linha[pos[col]]) * 100)
+            self.totais[col] = self._centavos[col] / 100
+
+    def _derivar(self, linha):
+        # A parte do município é sempre Total - Sebrae, inclusive após edição na grade
+        esq = self.esquema
+        linha[esq.pos[esq.col_municipio]] = _num(linha[esq.pos[esq.col_total]]) - _num(linha[esq.pos[esq.col_sebrae]])
+
+    def adicionar(self, registro):
+        linha = [registro.get(col) for col in self.colunas]
+        self._derivar(linha)
+        self._anexar(self._proximo_temporario, linha)
+        self.alterados[self.ids[-1]] = linha
+
+    def _anexar(self, id_linha, linha):
+        self.linhas.append(linha)
+        self.ids.append(id_linha)
+        self._proximo_temporario = min(self._proximo_temporario, id_linha - 1)
+        self._somar(linha, 1)
+
+    def restaurar(self, pares):
+        # Linhas já gravadas, como (id, linha): entram sem ficar pendentes de gravação
+        for id_linha, linha in pares:
+            self._anexar(id_linha, list(linha))
+        return self
+
+    def extrair_alterados(self):
+        alterados, self.alterados = self.alterados, {}
+        return alterados
+
+    def confirmar_ids(self, definitivos):
+        # {id provisório: id reservado no banco}
+        if definitivos:
+            self.ids = [definitivos.get(id_linha, id_linha) for id_linha in self.ids]
+
+    def aplicar_edicoes(self, delta):
+        # `delta` é o estado do st.data_editor: edited_rows / added_rows / deleted_rows,
+        # com posições relativas à tabela que foi exibida
+        for pos, alteracoes in delta.get('edited_rows', {}).items():
+            linha = self.linhas[int(pos)]
+            self._somar(linha, -1)
+            for col, valor in alteracoes.items():
+                if col in self.esquema.pos:
+                    linha[self.esquema.pos[col]] = valor
+            self._derivar(linha)
+            self._somar(linha, 1)
+            self.alterados[self.ids[int(pos)]] = linha
+        for registro in delta.get('added_rows', []):
+            self.adicionar(registro)
+        for pos in sorted(delta.get('deleted_rows', []), reverse=True):
+            self._somar(self.linhas.pop(pos), -1)
+            self.alterados[self.ids.pop(pos)] = None
+
+    def tabela(self):
+        # DataFrame para exibição/exportação; a página monta uma vez por execução e não o guarda
+        return pd.DataFrame(self.linhas, columns=list(self.colunas))
+
+
+def novo_investido(df=None):
+    return Lancamentos(ESQUEMA_ATUAL, df)
+
+
+def nova_proposta(df=None):
+    return Lancamentos(ESQUEMA_PROPOSTA, df)
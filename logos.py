@@ -0,0 +1,62 @@
+import argparse
+import hashlib
+import os
+
+pasta_raiz = os.path.dirname(os.path.abspath(__file__))
+
+# Servida pelo próprio Streamlit (server.enableStaticServing em .streamlit/config.toml)
+PASTA_STATIC = os.path.join(pasta_raiz, 'static')
+URL_STATIC = 'app/static'
+LOGOS = {'logo_sebrae.png': 75, 'logo_politicas_publicas.png': 70}
+# Variantes com o dobro da altura exibida, para telas de alta densidade
+ESCALA = 2
+
+
+def nome_variante(nome, altura, extensao):
+    return f"{os.path.splitext(nome)[0]}.{altura * ESCALA}.{extensao}"
+
+
+def _url(nome):
+    # O hash do conteúdo na URL deixa o navegador reaproveitar a imagem entre
+    # execuções e trocá-la só quando o arquivo mudar
+    with open(os.path.join(PASTA_STATIC, nome), 'rb') as f:
+        versao = hashlib.sha1(f.read()).hexdigest()[:10]
+    return f"{URL_STATIC}/{nome}?v={versao}"
+
+
+def html_logo(nome, altura):
+    png = nome_variante(nome, altura, 'png')
+    webp = nome_variante(nome, altura, 'webp')
+    img = f'<img src="{_url(png if os.path.exists(os.path.join(PASTA_STATIC, png)) else nome)}" height="{altura}">'
+    if not os.path.exists(os.path.join(PASTA_STATIC, webp)):
+        return img
+    return f'<picture><source srcset="{_url(webp)}" type="image/webp">{img}</picture>'
+
+
+def gerar_variantes(nome, altura, pasta=PASTA_STATIC):
+    from PIL import Image
+
+    with Image.open(os.path.join(pasta, nome)) as img:
+        alvo = altura * ESCALA
+        reduzida = img.resize((round(img.width * alvo / img.height), alvo), Image.LANCZOS)
+    caminhos = [os.path.join(pasta, nome_variante(nome, altura, 'png')),
+                os.path.join(pasta, nome_variante(nome, altura, 'webp'))]
+    reduzida.save(caminhos[0], optimize=True)
+    reduzida.save(caminhos[1], quality=90, method=6)
+    return caminhos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera versões reduzidas (PNG/WebP) dos logos do cabeçalho.')
+    parser.add_argument('--pasta', default=PASTA_STATIC)
+    args = parser.parse_args()
+
+    for nome, altura in LOGOS.items():
+        original = os.path.getsize(os.path.join(args.pasta, nome))
+        for caminho in gerar_variantes(nome, altura, args.pasta):
+            print(f"{os.path.basename(caminho)}: {os.path.getsize(caminho) / 1024:.1f} KB "
+                  f"(original {original / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import glob
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import xlsxwriter
+
+import cache_dados
+from indice_dados import IndiceDados
+
+COLUNAS_ATUAL = ['INICIATIVA', 'SEBRAE/PR', 'MUNICIPIO', 'TOTAL']
+COLUNAS_PROPOSTA = ['INICIATIVA', 'SOLUCAO', 'SUBSIDIO', 'VALOR_MUNICIPIO', 'VALOR']
+COLUNAS_VALOR = ['SEBRAE/PR', 'MUNICIPIO', 'TOTAL', 'SUBSIDIO', 'VALOR_MUNICIPIO', 'VALOR']
+SUFIXO_CSV = '_proposta_salva.csv'
+DTYPES_CSV = {'TIPO': 'str', 'INICIATIVA': 'str', 'SOLUCAO': 'str', **dict.fromkeys(COLUNAS_VALOR, 'float64')}
+LIMITE_CSV_MB = 20
+LIMITE_LINHAS_CSV = 50_000
+LINHAS_POR_BLOCO = 5_000
+ABA_RESUMO = 'Resumo_Proposta'
+# Linhas de uma planilha do Excel (índices 0 a 1.048.575), contando a do cabeçalho
+MAX_LINHAS_XLSX = 1_048_576
+
+
+class PropostaInvalida(ValueError):
+    pass
+
+
+def formata_reais(valor):
+    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def tabela_vazia(colunas):
+    return pd.DataFrame(columns=colunas)
+
+
+def municipio_do_arquivo(caminho):
+    nome = os.path.basename(caminho)
+    return nome[:-len(SUFIXO_CSV)] if nome.endswith(SUFIXO_CSV) else os.path.splitext(nome)[0]
+
+
+def _tamanho(arquivo):
+    if isinstance(arquivo, (str, os.PathLike)):
+        return os.path.getsize(arquivo)
+    return getattr(arquivo, 'size', None)
+
+
+def _secao(bloco, mascara, colunas, tipo):
+    # Só são exigidas as colunas das seções que têm linhas: arquivos salvos pela versão anterior
+    # do app podem vir sem as colunas da tabela vazia, que voltam aqui como vazias (NaN)
+    parte = bloco.loc[mascara]
+    faltando = [c for c in colunas if c not in bloco.columns]
+    if faltando and len(parte):
+        raise PropostaInvalida(f"Colunas ausentes para as linhas {tipo}: {', '.join(faltando)}.")
+    return parte.reindex(columns=colunas)
+
+
+def ler_proposta_csv(arquivo, limite_mb=LIMITE_CSV_MB, limite_linhas=LIMITE_LINHAS_CSV):
+    # Lê o .csv salvo em blocos, com tipos fixos, separando ATUAL/PROPOSTA na mesma passada
+    tamanho = _tamanho(arquivo)
+    if tamanho is not None and tamanho > limite_mb * 1024 * 1024:
+        raise PropostaInvalida(f"Arquivo com {tamanho / 1024 / 1024:.1f} MB excede o limite de {limite_mb} MB.")
+
+    partes_at, partes_pr, linhas = [], [], 0
+    try:
+        leitor = pd.read_csv(arquivo, dtype=DTYPES_CSV, encoding='utf-8-sig', chunksize=LINHAS_POR_BLOCO)
+        for bloco in leitor:
+            if 'TIPO' not in bloco.columns:
+                raise PropostaInvalida("Coluna ausente no arquivo: TIPO.")
+            linhas += len(bloco)
+            if linhas > limite_linhas:
+                raise PropostaInvalida(f"Arquivo com mais de {limite_linhas} linhas.")
+            tipo = bloco['TIPO']
+            partes_at.append(_secao(bloco, tipo == 'ATUAL', COLUNAS_ATUAL, 'ATUAL'))
+            partes_pr.append(_secao(bloco, tipo == 'PROPOSTA', COLUNAS_PROPOSTA, 'PROPOSTA'))
+    except PropostaInvalida:
+        raise
+    except pd.errors.EmptyDataError:
+        raise PropostaInvalida("Arquivo vazio.")
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise PropostaInvalida(f"Arquivo fora do formato da proposta salva: {e}")
+
+    df_at = pd.concat(partes_at, ignore_index=True) if partes_at else tabela_vazia(COLUNAS_ATUAL)
+    df_pr = pd.concat(partes_pr, ignore_index=True) if partes_pr else tabela_vazia(COLUNAS_PROPOSTA)
+    return df_at, df_pr
+
+
+def juntar_proposta(df_investido, df_proposta):
+    return pd.concat([df_investido.assign(TIPO='ATUAL'), df_proposta.assign(TIPO='PROPOSTA')], ignore_index=True)
+
+
+def calcular_totais(df_investido, df_proposta):
+    df1_f, df2_f = df_investido.fillna(0), df_proposta.fillna(0)
+    tot_g = df1_f['TOTAL'].sum() + df2_f['VALOR'].sum()
+    tot_s = df1_f['SEBRAE/PR'].sum() + df2_f['SUBSIDIO'].sum()
+    tot_m = df1_f['MUNICIPIO'].sum() + df2_f['VALOR_MUNICIPIO'].sum()
+    return tot_g, tot_s, tot_m
+
+
+def formatos_resumo(workbook):
+    return {'moeda': workbook.add_format({'num_format': 'R$ #,##0.00'}),
+            'titulo': workbook.add_format({'bold': True, 'font_color': '#0054A6', 'font_size': 12})}
+
+
+def _escrever_tabela(ws, linha, df):
+    ws.write_row(linha, 0, list(df.columns))
+    for i, valores in enumerate(df.itertuples(index=False, name=None), start=linha + 1):
+        for col, valor in enumerate(valores):
+            if not pd.isna(valor):
+                ws.write(i, col, valor)
+
+
+def linhas_resumo(df_investido, df_proposta):
+    # Linhas ocupadas por escrever_resumo: título, seção e cabeçalho de cada tabela, os
+    # espaçamentos e as 4 linhas do consolidado
+    return len(df_investido) + len(df_proposta) + 12
+
+
+def escrever_resumo(ws, linha, df_investido, df_proposta, municipio, totais, fmt):
+    # Layout da aba Resumo_Proposta a partir de `linha`, sempre em ordem crescente de linhas
+    # (exigência do modo constant_memory do xlsxwriter). Devolve a próxima linha livre.
+    tot_g, tot_s, tot_m = totais
+    ws.write(linha, 0, f"SIMULADOR DE AÇÕES MUNICIPAIS: {municipio}", fmt['titulo'])
+    ws.write(linha + 1, 0, "JÁ INVESTIDO NO MUNICÍPIO", fmt['titulo'])
+    _escrever_tabela(ws, linha + 2, df_investido)
+
+    row_prop = linha + len(df_investido) + 5
+    ws.write(row_prop - 1, 0, "PROPOSTA DE PARCERIA", fmt['titulo'])
+    _escrever_tabela(ws, row_prop, df_proposta)
+
+    row_total = row_prop + len(df_proposta) + 3
+    ws.write(row_total, 0, "CONSOLIDADO FINAL", fmt['titulo'])
+    ws.write(row_total + 1, 0, "Investimento Total:")
+    ws.write(row_total + 1, 1, tot_g, fmt['moeda'])
+    ws.write(row_total + 2, 0, "Subsídio Sebrae/PR:")
+    ws.write(row_total + 2, 1, tot_s, fmt['moeda'])
+    ws.write(row_total + 3, 0, "Aporte Município:")
+    ws.write(row_total + 3, 1, tot_m, fmt['moeda'])
+    return row_total + 4
+
+
+def gerar_excel(destino, df_investido, df_proposta, municipio, totais=None):
+    totais = totais if totais is not None else calcular_totais(df_investido, df_proposta)
+    # in_memory evita os arquivos temporários que o xlsxwriter cria por planilha
+    workbook = xlsxwriter.Workbook(destino, {'in_memory': True})
+    fmt = formatos_resumo(workbook)
+    ws = workbook.add_worksheet(ABA_RESUMO)
+    ws.set_column(1, 4, 18, fmt['moeda'])
+    escrever_resumo(ws, 0, df_investido, df_proposta, municipio, totais, fmt)
+    workbook.close()
+
+
+def excel_bytes(df_investido, df_proposta, municipio, totais=None):
+    buffer = io.BytesIO()
+    gerar_excel(buffer, df_investido, df_proposta, municipio, totais)
+    return buffer.getvalue()
+
+
+def csv_bytes(df_investido, df_proposta):
+    return juntar_proposta(df_investido, df_proposta).to_csv(index=False).encode('utf-8-sig')
+
+
+def _processar_arquivo(args):
+    caminho, pasta_saida = args
+    municipio = municipio_do_arquivo(caminho)
+    try:
+        df_at, df_pr = ler_proposta_csv(caminho)
+    except PropostaInvalida as e:
+        return None, f"{os.path.basename(caminho)}: {e}"
+    if pasta_saida:
+        gerar_excel(os.path.join(pasta_saida, f"proposta_acoes_{municipio}.xlsx"), df_at, df_pr, municipio)
+    return juntar_proposta(df_at, df_pr).assign(ARQUIVO=os.path.basename(caminho), MUN=municipio), None
+
+
+def consolidar(tabelas, indice=None):
+    # Uma tabela longa com todas as propostas; os totais saem de um único groupby
+    todas = pd.concat(tabelas or [tabela_vazia(['TIPO'])], ignore_index=True).reindex(
+        columns=['ARQUIVO', 'MUN', 'TIPO'] + COLUNAS_VALOR)
+    todas['ITENS_ATUAL'] = todas['TIPO'].eq('ATUAL')
+    todas['ITENS_PROPOSTA'] = todas['TIPO'].eq('PROPOSTA')
+    somas = todas.groupby(['ARQUIVO', 'MUN'], sort=False)[COLUNAS_VALOR + ['ITENS_ATUAL', 'ITENS_PROPOSTA']].sum()
+    totais = pd.DataFrame({
+        'TOTAL': somas['TOTAL'] + somas['VALOR'],
+        'SEBRAE/PR': somas['SEBRAE/PR'] + somas['SUBSIDIO'],
+        'MUNICIPIO': somas['MUNICIPIO'] + somas['VALOR_MUNICIPIO'],
+        'ITENS_ATUAL': somas['ITENS_ATUAL'],
+        'ITENS_PROPOSTA': somas['ITENS_PROPOSTA'],
+    }).reset_index()
+    if indice is not None:
+        totais.insert(2, 'REG', totais['MUN'].map({nome: m.reg for nome, m in indice.por_municipio.items()}))
+        totais.insert(3, 'TER', totais['MUN'].map({nome: m.ter for nome, m in indice.por_municipio.items()}))
+    return totais
+
+
+def processar_lote(arquivos, pasta_saida=None, indice=None, processos=None):
+    if pasta_saida:
+        os.makedirs(pasta_saida, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        resultados = list(executor.map(_processar_arquivo, [(a, pasta_saida) for a in arquivos], chunksize=16))
+    tabelas = [df for df, _ in resultados if df is not None]
+    erros = [erro for _, erro in resultados if erro]
+    return consolidar(tabelas, indice), erros
+
+
+def listar_arquivos(entradas):
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            # Numa pasta, só os arquivos do botão "Salvar proposta"; outros .csv (resumos, totais) ficam de fora
+            arquivos += sorted(glob.glob(os.path.join(entrada, f'*{SUFIXO_CSV}')))
+        else:
+            arquivos += sorted(glob.glob(entrada))
+    return arquivos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consolida propostas salvas (.csv) sem abrir o simulador.')
+    parser.add_argument('entradas', nargs='+', help='arquivos, padrões glob ou pastas com os .csv salvos')
+    parser.add_argument('--saida', default='propostas_consolidadas')
+    parser.add_argument('--sem-excel', action='store_true', help='não gera o .xlsx de cada proposta')
+    parser.add_argument('--processos', type=int, default=None)
+    args = parser.parse_args()
+
+    arquivos = listar_arquivos(args.entradas)
+    if not arquivos:
+        parser.error('nenhum arquivo .csv encontrado')
+    os.makedirs(args.saida, exist_ok=True)
+    indice = IndiceDados(*cache_dados.carregar_dados())
+    totais, erros = processar_lote(arquivos, None if args.sem_excel else args.saida, indice, args.processos)
+    destino = os.path.join(args.saida, 'totais_propostas.csv')
+    totais.to_csv(destino, index=False, encoding='utf-8-sig')
+    print(f"{len(arquivos) - len(erros)} propostas consolidadas em {destino}")
+    for erro in erros:
+        print(f"  ignorado: {erro}")
+    print(f"Total: R$ {formata_reais(totais['TOTAL'].sum())} | Sebrae/PR: R$ {formata_reais(totais['SEBRAE/PR'].sum())}"
+          f" | Município: R$ {formata_reais(totais['MUNICIPIO'].sum())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import cache_dados
+from indice_dados import IndiceDados
+from motor_propostas import COLUNAS_ATUAL, COLUNAS_PROPOSTA, SUFIXO_CSV, csv_bytes, formata_reais, tabela_vazia
+
+# A planilha não liga iniciativas a eixos do IDAN-M: o mapa fica em eixos_iniciativas.csv
+# (colunas INICIATIVA, EIXO), editável no Excel pela equipe. Iniciativas fora dele não entram na sugestão.
+CAMINHO_EIXOS = os.environ.get('SIMULADOR_EIXOS', os.path.join(cache_dados.pasta_raiz, 'eixos_iniciativas.csv'))
+# Peso extra para os eixos apontados como OPORTUNIDADES do município
+BONUS_OPORTUNIDADE = 1.0
+# Referência da escala de retorno decrescente do investimento (R$)
+VALOR_REFERENCIA = 10_000
+# Nº máximo de faixas de orçamento na programação dinâmica (por dimensão)
+FAIXAS = 400
+# Orçamentos combinados (Sebrae x município) na verificação de monotonia (--verificar)
+ESCADA_ORCAMENTOS = (0, 10_000, 50_000, 100_000, 150_000, 500_000, 1_000_000, 10_000_000)
+
+
+def carregar_mapa_eixos(caminho=CAMINHO_EIXOS):
+    df = pd.read_csv(caminho, dtype=str, encoding='utf-8-sig').dropna(subset=['INICIATIVA', 'EIXO'])
+    return dict(zip(df['INICIATIVA'].str.strip(), df['EIXO'].str.strip()))
+
+
+def _catalogo(indice, mapa):
+    # Uma lista de alternativas por iniciativa: no máximo uma solução de cada entra na proposta
+    grupos = []
+    for inic, solucoes in indice.solucoes.items():
+        if inic not in mapa:
+            continue
+        itens = []
+        for sol, (valor, sub) in solucoes.items():
+            valor = pd.to_numeric(valor, errors='coerce')
+            if pd.isna(valor):
+                continue
+            sub = 0.0 if pd.isna(sub) else float(sub)
+            itens.append((sol, float(valor), sub))
+        if itens:
+            grupos.append((inic, mapa[inic], itens))
+    return grupos
+
+
+def pesos_eixos(indice, municipio):
+    selec = indice.municipio(municipio)
+    pesos = {eixo: 1.0 - pct for eixo, pct in zip(selec.eixos, selec.percentuais)}
+    for i in indice.oportunidades(municipio):
+        pesos[selec.eixos[i]] += BONUS_OPORTUNIDADE
+    return pesos
+
+
+def pontuacao(peso, valor):
+    # Retorno decrescente: soluções maiores pontuam mais no mesmo eixo, mas o orçamento
+    # tende a se espalhar pelos eixos mais fracos; soluções gratuitas ainda pontuam
+    return peso * (math.log1p(valor / VALOR_REFERENCIA) + 0.1)
+
+
+def _faixas(custo, passo):
+    return math.ceil(max(custo, 0.0) / passo - 1e-9)
+
+
+def otimizar(indice, municipio, orcamento_sebrae, orcamento_municipio, mapa=None, grupos=None):
+    # Mochila de múltipla escolha com dois orçamentos (subsídio Sebrae e aporte do município),
+    # resolvida por programação dinâmica sobre uma grade de faixas de valor
+    if grupos is None:
+        grupos = _catalogo(indice, mapa if mapa is not None else carregar_mapa_eixos())
+    pesos = pesos_eixos(indice, municipio)
+    # Uma grade por orçamento: com um passo só, o orçamento menor ficaria com poucas faixas
+    passo_s, passo_m = max(1.0, orcamento_sebrae / FAIXAS), max(1.0, orcamento_municipio / FAIXAS)
+    cap_s, cap_m = int(orcamento_sebrae // passo_s), int(orcamento_municipio // passo_m)
+
+    melhor = np.zeros((cap_s + 1, cap_m + 1))
+    escolhas = []
+    for inic, eixo, itens in grupos:
+        novo, escolha = melhor.copy(), np.full(melhor.shape, -1, dtype=np.int16)
+        for k, (_, valor, sub) in enumerate(itens):
+            # Custos arredondados para cima: a sugestão nunca estoura o orçamento
+            cs, cm = _faixas(sub, passo_s), _faixas(valor - sub, passo_m)
+            if cs > cap_s or cm > cap_m:
+                continue
+            candidato = melhor[:cap_s + 1 - cs, :cap_m + 1 - cm] + pontuacao(pesos.get(eixo, 0.0), valor)
+            alvo = novo[cs:, cm:]
+            ganhou = candidato > alvo
+            alvo[ganhou] = candidato[ganhou]
+            escolha[cs:, cm:][ganhou] = k
+        melhor = novo
+        escolhas.append(escolha)
+
+    linhas, s, m = [], cap_s, cap_m
+    for (inic, eixo, itens), escolha in zip(reversed(grupos), reversed(escolhas)):
+        k = escolha[s, m]
+        if k < 0:
+            continue
+        sol, valor, sub = itens[k]
+        s -= _faixas(sub, passo_s)
+        m -= _faixas(valor - sub, passo_m)
+        linhas.append({'INICIATIVA': inic, 'SOLUCAO': sol, 'SUBSIDIO': sub, 'VALOR_MUNICIPIO': valor - sub,
+                       'VALOR': valor, 'EIXO': eixo})
+    return pd.DataFrame(linhas[::-1], columns=COLUNAS_PROPOSTA + ['EIXO'])
+
+
+def pontuacao_proposta(pesos, df):
+    return sum(pontuacao(pesos.get(eixo, 0.0), valor) for eixo, valor in zip(df['EIXO'], df['VALOR']))
+
+
+def verificar_monotonia(indice, municipio, escada=ESCADA_ORCAMENTOS, grupos=None):
+    # Aumentar qualquer um dos dois orçamentos nunca pode piorar a sugestão. Compara cada ponto da
+    # escada com o degrau seguinte em cada dimensão e devolve as violações como
+    # ((sebrae, município), (sebrae, município) maior, nota, nota menor)
+    grupos = grupos if grupos is not None else _catalogo(indice, carregar_mapa_eixos())
+    pesos = pesos_eixos(indice, municipio)
+    notas = {(s, m): pontuacao_proposta(pesos, otimizar(indice, municipio, s, m, grupos=grupos))
+             for s in escada for m in escada}
+    violacoes = []
+    for i, s in enumerate(escada):
+        for j, m in enumerate(escada):
+            for maior in ((escada[i + 1], m) if i + 1 < len(escada) else None,
+                          (s, escada[j + 1]) if j + 1 < len(escada) else None):
+                if maior and notas[maior] < notas[(s, m)] - 1e-9:
+                    violacoes.append(((s, m), maior, notas[(s, m)], notas[maior]))
+    return violacoes
+
+
+_indice_processo = None
+_grupos_processo = None
+
+
+def _iniciar_processo(indice, mapa):
+    global _indice_processo, _grupos_processo
+    _indice_processo = indice
+    _grupos_processo = _catalogo(indice, mapa)
+
+
+def _otimizar_municipio(args):
+    municipio, orcamento_sebrae, orcamento_municipio = args
+    return municipio, otimizar(_indice_processo, municipio, orcamento_sebrae, orcamento_municipio,
+                               grupos=_grupos_processo)
+
+
+def _verificar_municipio(municipio):
+    return municipio, verificar_monotonia(_indice_processo, municipio, grupos=_grupos_processo)
+
+
+def verificar_todos(indice, municipios=None, processos=None, mapa=None):
+    mapa = mapa if mapa is not None else carregar_mapa_eixos()
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo,
+                             initargs=(indice, mapa)) as executor:
+        return {mun: violacoes for mun, violacoes in executor.map(_verificar_municipio,
+                                                                  municipios or indice.municipios, chunksize=8)
+                if violacoes}
+
+
+def otimizar_todos(indice, orcamento_sebrae, orcamento_municipio, municipios=None, processos=None, mapa=None):
+    tarefas = [(mun, orcamento_sebrae, orcamento_municipio) for mun in (municipios or indice.municipios)]
+    mapa = mapa if mapa is not None else carregar_mapa_eixos()
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo,
+                             initargs=(indice, mapa)) as executor:
+        return dict(executor.map(_otimizar_municipio, tarefas, chunksize=8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sugere a melhor combinação de soluções para cada município.')
+    parser.add_argument('--sebrae', type=float, help='orçamento de subsídio Sebrae/PR (R$)')
+    parser.add_argument('--municipio', type=float, help='orçamento de aporte do município (R$)')
+    parser.add_argument('--saida', default='propostas_sugeridas')
+    parser.add_argument('--eixos', default=CAMINHO_EIXOS, help='.csv com as colunas INICIATIVA e EIXO')
+    parser.add_argument('--processos', type=int, default=None)
+    parser.add_argument('--verificar', action='store_true',
+                        help='confere em todos os municípios que aumentar um orçamento nunca piora a sugestão')
+    args = parser.parse_args()
+    if not args.verificar and (args.sebrae is None or args.municipio is None):
+        parser.error('--sebrae e --municipio são obrigatórios')
+
+    indice = IndiceDados(*cache_dados.carregar_dados())
+    if args.verificar:
+        violacoes = verificar_todos(indice, processos=args.processos, mapa=carregar_mapa_eixos(args.eixos))
+        for mun, lista in violacoes.items():
+            for menor, maior, nota, nota_maior in lista:
+                print(f"{mun}: {menor} -> {maior} piora a nota de {nota:.4f} para {nota_maior:.4f}")
+        print(f"{len(indice.municipios)} municípios verificados, {len(violacoes)} com violação")
+        sys.exit(1 if violacoes else 0)
+
+    sugestoes = otimizar_todos(indice, args.sebrae, args.municipio, processos=args.processos,
+                               mapa=carregar_mapa_eixos(args.eixos))
+    os.makedirs(args.saida, exist_ok=True)
+    resumo = []
+    for mun, df in sugestoes.items():
+        # Mesmo formato do botão "Salvar proposta": pode ser aberto em "Continuar proposta salva"
+        with open(os.path.join(args.saida, f"{mun}{SUFIXO_CSV}"), 'wb') as f:
+            f.write(csv_bytes(tabela_vazia(COLUNAS_ATUAL), df[COLUNAS_PROPOSTA]))
+        resumo.append({'MUN': mun, 'ITENS': len(df), 'SUBSIDIO': df['SUBSIDIO'].sum(),
+                       'VALOR_MUNICIPIO': df['VALOR_MUNICIPIO'].sum(), 'VALOR': df['VALOR'].sum()})
+    resumo = pd.DataFrame(resumo)
+    # Fora da pasta das propostas, que pode ser passada direto ao motor_propostas/exportacao_estadual
+    destino = os.path.join(os.path.dirname(os.path.abspath(args.saida)),
+                           f"{os.path.basename(os.path.normpath(args.saida))}_resumo.csv")
+    resumo.to_csv(destino, index=False, encoding='utf-8-sig')
+    print(f"{len(resumo)} propostas sugeridas em {args.saida} (resumo em {destino})")
+    print(f"Sebrae/PR: R$ {formata_reais(resumo['SUBSIDIO'].sum())} | "
+          f"Município: R$ {formata_reais(resumo['VALOR_MUNICIPIO'].sum())}")
+
+
+if __name__ == '__main__':
+    main()
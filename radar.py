@@ -0,0 +1,114 @@
+import argparse
+import hashlib
+import io
+import os
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.figure import Figure
+
+import cache_dados
+from indice_dados import IndiceDados
+
+PASTA_RADAR = os.path.join(cache_dados.PASTA_CACHE, 'radar')
+# Mesmos parâmetros que o st.pyplot usa por padrão
+OPCOES_SAVEFIG = {'bbox_inches': 'tight', 'dpi': 200}
+
+
+def figura_radar(categorias, valores):
+    n = len(categorias)
+    angulos = np.linspace(0, 2 * np.pi, n, endpoint=False).tolist()
+    valores = list(valores)
+    valores += valores[:1]
+    angulos += angulos[:1]
+
+    # Figure direto, sem pyplot: a figura não fica registrada no gerenciador
+    # global e é liberada assim que sai de escopo
+    fig = Figure(figsize=(6, 6))
+    ax = fig.add_subplot(projection='polar')
+    fig.patch.set_alpha(0)
+    ax.set_theta_offset(np.pi / 2)
+    ax.set_theta_direction(-1)
+    ax.grid(False)
+    ax.spines['polar'].set_visible(False)
+    ax.patch.set_visible(False)
+
+    for nivel in [0.2, 0.4, 0.6, 0.8, 1.0]:
+        ax.plot(angulos, [nivel] * len(angulos), color='gray', linestyle=':', linewidth=0.5)
+    for angulo in angulos[:-1]:
+        ax.plot([angulo, angulo], [0, 1], color='gray', linestyle=':', linewidth=0.5)
+
+    ax.fill(angulos, valores, color='#0054A6', alpha=0.25)
+    ax.plot(angulos, valores, color='#0054A6', linewidth=2)
+
+    cat_quebradas = [textwrap.fill(cat, width=17) for cat in categorias]
+    ax.set_xticks(angulos[:-1])
+    ax.set_xticklabels(cat_quebradas, fontsize=11)
+    ax.set_yticks([0.2, 0.4, 0.6, 0.8, 1.0])
+    ax.set_yticklabels(['20%', '40%', '60%', '80%', '100%'], fontsize=7, color='gray')
+    ax.set_ylim(0, 1.1)
+    return fig
+
+
+def renderizar_radar(categorias, valores, formato='png'):
+    fig = figura_radar(categorias, valores)
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format=formato, **OPCOES_SAVEFIG)
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+def caminho_radar(versao, municipio, formato='png', pasta=PASTA_RADAR):
+    nome = hashlib.sha1(municipio.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(pasta, versao[:16], f'{nome}.{formato}')
+
+
+def radar_municipio(indice, municipio, versao, formato='png', pasta=PASTA_RADAR):
+    # Usa a imagem pré-renderizada no deploy, se existir para esta versão dos dados
+    caminho = caminho_radar(versao, municipio, formato, pasta)
+    try:
+        with open(caminho, 'rb') as f:
+            return f.read()
+    except OSError:
+        selec = indice.municipio(municipio)
+        return renderizar_radar(selec.eixos, selec.percentuais, formato)
+
+
+def _renderizar_arquivo(args):
+    caminho, categorias, valores, formato = args
+    conteudo = renderizar_radar(categorias, valores, formato)
+    tmp = f'{caminho}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(conteudo)
+    os.replace(tmp, caminho)
+    return len(conteudo)
+
+
+def pre_renderizar(indice, versao, formatos=('png',), pasta=PASTA_RADAR, processos=None):
+    os.makedirs(os.path.join(pasta, versao[:16]), exist_ok=True)
+    tarefas = [(caminho_radar(versao, mun, formato, pasta), selec.eixos, selec.percentuais.tolist(), formato)
+               for formato in formatos
+               for mun, selec in indice.por_municipio.items()]
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        return sum(executor.map(_renderizar_arquivo, tarefas, chunksize=8)), len(tarefas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pré-renderiza o radar IDAN-M de todos os municípios.')
+    parser.add_argument('--formato', action='append', choices=['png', 'svg'],
+                        help='pode ser repetido; padrão: png')
+    parser.add_argument('--processos', type=int, default=None)
+    parser.add_argument('--pasta', default=PASTA_RADAR)
+    args = parser.parse_args()
+
+    versao = cache_dados.versao_dados()
+    indice = IndiceDados(*cache_dados.carregar_dados())
+    total_bytes, n = pre_renderizar(indice, versao, tuple(args.formato or ['png']), args.pasta, args.processos)
+    print(f"{n} gráficos gerados em {os.path.join(args.pasta, versao[:16])} ({total_bytes / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()